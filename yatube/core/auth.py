@@ -0,0 +1,53 @@
+"""Пользователь из кеша вместо запроса к auth_user на каждом запросе.
+
+AuthenticationMiddleware на каждом запросе загружает пользователя сессии;
+CachedModelBackend держит его в кеше AUTH_USER_CACHE_TIMEOUT секунд.
+Сохранение и удаление пользователя (смена профиля, пароля, вход)
+сбрасывают кешированную копию.
+
+Сброс должен дойти до всех воркеров, иначе отключённый или сменивший
+пароль пользователь остаётся вошедшим в соседних процессах, поэтому
+с кешем, который у каждого процесса свой (LocMemCache), пользователь
+не кешируется.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .cache import is_shared
+
+USER_KEY = 'core:user:%s'
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not is_shared(caches[DEFAULT_CACHE_ALIAS]):
+            return super().get_user(user_id)
+        key = USER_KEY % user_id
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+
+def forget_user(sender, instance, **kwargs):
+    key = USER_KEY % instance.pk
+    # Ещё раз после фиксации: параллельный запрос мог успеть положить
+    # в кеш копию до изменения.
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def connect():
+    user_model = get_user_model()
+    post_save.connect(
+        forget_user, sender=user_model, dispatch_uid='core.auth.saved'
+    )
+    post_delete.connect(
+        forget_user, sender=user_model, dispatch_uid='core.auth.deleted'
+    )
@@ -0,0 +1,354 @@
+"""Общий для всех процессов кеш в файле SQLite.
+
+LocMemCache у каждого WSGI-воркера свой, поэтому кеш страниц дублируется
+и не сбрасывается в соседних процессах. SQLiteCache хранит записи в одном
+файле (WAL, без внешних сервисов), вытесняет давно не читанные записи по
+LRU и ограничивает как число записей, так и их суммарный размер;
+значения больше MAX_VALUE_SIZE (по умолчанию четверть MAX_SIZE) не
+кешируются.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000, 'MAX_SIZE': 256 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    '''CREATE TABLE IF NOT EXISTS cache_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO cache_totals VALUES (1, 0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_totals
+        SET entries = entries + 1, size = size + new.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_totals
+        SET entries = entries - 1, size = size - old.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_update
+    AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_totals SET size = size - old.size + new.size;
+    END''',
+)
+
+# Время последнего чтения обновляется не чаще, чем раз в столько секунд,
+# чтобы горячие ключи не превращали каждое чтение в запись.
+ACCESS_RESOLUTION = 1.0
+
+
+def is_shared(backend):
+    """Видят ли записи в backend другие процессы.
+
+    LocMemCache у каждого процесса свой, DummyCache ничего не хранит:
+    удаление ключа в одном воркере до остальных не дойдёт.
+    """
+    return not isinstance(backend, (LocMemCache, DummyCache))
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._max_size = int(options.get('MAX_SIZE', 64 * 2 ** 20))
+        # Значения больше MAX_VALUE_SIZE не кешируются: одно такое значение
+        # вытеснило бы всё остальное.
+        self._max_value_size = int(
+            options.get('MAX_VALUE_SIZE', self._max_size // 4)
+        )
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # После fork соединение родителя использовать нельзя.
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _read(self, connection, key):
+        row = connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now)
+            )
+            return None
+        if now - accessed > ACCESS_RESOLUTION:
+            connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return value
+
+    def get(self, key, default=None, version=None):
+        value = self._read(self._connection, self._key(key, version))
+        return default if value is None else pickle.loads(value)
+
+    def _write(self, connection, key, value, timeout, only_missing=False):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self._max_value_size:
+            # Как при неудачной записи в memcached: старое значение
+            # не должно остаться вместо нового.
+            if not only_missing:
+                connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return False
+        now = time.time()
+        condition = 'WHERE cache.expires <= excluded.accessed' \
+            if only_missing else ''
+        cursor = connection.execute(
+            f'''INSERT INTO cache (key, value, expires, accessed, size)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value,
+                expires = excluded.expires,
+                accessed = excluded.accessed,
+                size = excluded.size
+            {condition}''',
+            (key, data, self.get_backend_timeout(timeout), now, len(data)),
+        )
+        written = cursor.rowcount > 0
+        if written:
+            self._cull(connection)
+        return written
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(self._connection, self._key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(
+            self._connection, self._key(key, version), value, timeout,
+            only_missing=True,
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?',
+            (self.get_backend_timeout(timeout), self._key(key, version)),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            value = self._read(connection, key)
+            if value is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(value) + delta
+            data = pickle.dumps(new_value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (data, len(data), key),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return new_value
+
+    def has_key(self, key, version=None):
+        return self._read(self._connection, self._key(key, version)) \
+            is not None
+
+    def delete(self, key, version=None):
+        self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_totals'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        # Вытесняем давно не читанные записи, пока не освободится
+        # 1/cull_frequency от лимитов, чтобы не чистить кеш на каждой записи.
+        keep = 1 - 1 / self._cull_frequency if self._cull_frequency else 0
+        while True:
+            entries, size = connection.execute(
+                'SELECT entries, size FROM cache_totals'
+            ).fetchone()
+            excess = entries - int(self._max_entries * keep)
+            if size > self._max_size * keep:
+                # Хотя бы одна запись за проход, даже если записей меньше
+                # cull_frequency.
+                excess = max(
+                    excess, entries // (self._cull_frequency or 1), 1
+                )
+            if excess <= 0 or not entries:
+                return
+            connection.execute(
+                '''DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed LIMIT ?
+                )''',
+                (max(excess, 1),),
+            )
+
+
+class LocalLRU:
+    """Ограниченный по числу записей LRU-кеш процесса с коротким TTL."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TwoTierCache:
+    """LRU процесса перед общим кешем CACHES[alias].
+
+    Локальный уровень не получает сообщений о сбросе от других процессов,
+    поэтому в него кладутся только неизменяемые значения под ключами,
+    содержащими версию (например, поколение ленты). Смена версии
+    в общем кеше делает старые локальные записи недостижимыми, а TTL
+    ограничивает время, которое они занимают память.
+    """
+
+    tiers = ('local', 'shared')
+    # Все экземпляры процесса: их счётчики выводит core.metrics.
+    instances = weakref.WeakSet()
+
+    def __init__(self, alias='default', max_entries=256, timeout=5,
+                 name=None):
+        self.alias = alias
+        self.name = name or alias
+        self.local = LocalLRU(max_entries, timeout)
+        self._counters = {
+            (tier, result): 0
+            for tier in self.tiers for result in ('hits', 'misses')
+        }
+        self._lock = threading.Lock()
+        self.instances.add(self)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, tier, hit):
+        with self._lock:
+            self._counters[tier, 'hits' if hit else 'misses'] += 1
+
+    def get(self, key, default=None, is_fresh=None):
+        """Значение из ближайшего уровня.
+
+        Если задан is_fresh, локальная копия, не прошедшая проверку,
+        считается промахом и значение читается из общего кеша; оттуда оно
+        возвращается даже устаревшим - решать, что с ним делать, вызывающему.
+        """
+        value = self.local.get(key)
+        usable = value is not None and (is_fresh is None or is_fresh(value))
+        self._count('local', usable)
+        if usable:
+            return value
+        value = self.shared.get(key)
+        self._count('shared', value is not None)
+        if value is None:
+            return default
+        if is_fresh is None or is_fresh(value):
+            self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                tier: {
+                    'hits': self._counters[tier, 'hits'],
+                    'misses': self._counters[tier, 'misses'],
+                }
+                for tier in self.tiers
+            }
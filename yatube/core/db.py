@@ -0,0 +1,35 @@
+"""Профиль SQLite для продакшена.
+
+По умолчанию файл базы работает в режиме журнала отката: писатель
+блокирует всю базу, читатели ждут его, а при одновременной записи
+комментариев, подписок и постов запросы падают с "database is locked".
+При SQLITE_PRODUCTION каждое новое соединение переводится в режим WAL
+(читатели не мешают писателю), получает mmap, увеличенный кеш страниц,
+временные таблицы в памяти и ожидание блокировки вместо ошибки.
+Прагмы задаются в SQLITE_PRAGMAS.
+
+busy_timeout не спасает транзакцию, которая начала с чтения и потом
+пытается писать, пока пишет другое соединение: SQLite сразу отвечает
+SQLITE_BUSY. Короткие транзакции в autocommit это не затрагивает.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def apply_pragmas(cursor, pragmas):
+    """Выполняет PRAGMA name=value для каждой пары из pragmas."""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRODUCTION:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
+
+
+def connect():
+    connection_created.connect(
+        configure_connection, dispatch_uid='core.db.configure_connection'
+    )
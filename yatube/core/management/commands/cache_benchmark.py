@@ -0,0 +1,79 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import (
+    Command as CreateCacheTable,
+)
+from django.db import connection
+
+from core.cache import SQLiteCache
+
+TABLE = 'cache_benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку чтения существующего ключа (cache hit) '
+        'для LocMemCache, SQLiteCache и DatabaseCache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument(
+            '--size', type=int, default=20000,
+            help='Размер значения в байтах (порядка страницы ленты).',
+        )
+        parser.add_argument('--keys', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            create_table = CreateCacheTable()
+            create_table.verbosity = 0
+            create_table.create_table('default', TABLE, False)
+            try:
+                backends = {
+                    'locmem': LocMemCache('cache-benchmark', {}),
+                    'sqlite': SQLiteCache(
+                        os.path.join(directory, 'cache.sqlite3'), {}
+                    ),
+                    'db': DatabaseCache(TABLE, {}),
+                }
+                self.stdout.write(
+                    f'{"backend":<8} {"mean, µs":>10} {"p50, µs":>10} '
+                    f'{"p99, µs":>10} {"ops/s":>10}'
+                )
+                for name, cache in backends.items():
+                    self._report(name, self._measure(cache, **options))
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'DROP TABLE %s' % connection.ops.quote_name(TABLE)
+                    )
+
+    def _measure(self, cache, iterations, size, keys, **options):
+        value = os.urandom(size)
+        names = [f'page:{number}' for number in range(keys)]
+        for name in names:
+            cache.set(name, value, None)
+        timings = []
+        for number in range(iterations):
+            name = names[number % keys]
+            started = time.perf_counter()
+            cache.get(name)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _report(self, name, timings):
+        timings.sort()
+        micro = [timing * 1e6 for timing in timings]
+        self.stdout.write(
+            f'{name:<8} {statistics.mean(micro):>10.1f} '
+            f'{micro[len(micro) // 2]:>10.1f} '
+            f'{micro[int(len(micro) * 0.99)]:>10.1f} '
+            f'{len(timings) / sum(timings):>10.0f}'
+        )
@@ -0,0 +1,133 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT NOT NULL)',
+    '''CREATE TABLE comment (
+        id INTEGER PRIMARY KEY,
+        post_id INTEGER NOT NULL REFERENCES post (id),
+        text TEXT NOT NULL,
+        created REAL NOT NULL
+    )''',
+    'CREATE INDEX comment_post_created ON comment (post_id, created)',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи SQLite '
+        'при одновременной работе нескольких потоков: с настройками '
+        'по умолчанию и с прагмами SQLITE_PRAGMAS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Длительность прогона каждого профиля в секундах.',
+        )
+        parser.add_argument('--posts', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default': {},
+            'production': settings.SQLITE_PRAGMAS,
+        }
+        self.stdout.write(
+            f'{"profile":<11} {"reads/s":>10} {"writes/s":>10} '
+            f'{"errors":>8}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas in profiles.items():
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self._prepare(path, options['posts'])
+                self._report(name, self._run(path, pragmas, **options))
+
+    def _connect(self, path, pragmas):
+        # Как у Django: autocommit и ожидание блокировки по умолчанию.
+        connection = sqlite3.connect(path, isolation_level=None)
+        apply_pragmas(connection.cursor(), pragmas)
+        return connection
+
+    def _prepare(self, path, posts):
+        connection = sqlite3.connect(path, isolation_level=None)
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                'INSERT INTO post (id, text) VALUES (?, ?)',
+                ((number, f'Пост {number}') for number in range(posts)),
+            )
+        connection.close()
+
+    def _run(self, path, pragmas, readers, writers, duration, posts,
+             **options):
+        totals = {'read': 0, 'write': 0, 'errors': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(readers + writers)
+
+        def read(cursor):
+            cursor.execute(
+                'SELECT id, text, created FROM comment WHERE post_id = ? '
+                'ORDER BY created DESC LIMIT 20',
+                (random.randrange(posts),),
+            ).fetchall()
+
+        def write(cursor):
+            cursor.execute(
+                'INSERT INTO comment (post_id, text, created) '
+                'VALUES (?, ?, ?)',
+                (random.randrange(posts), 'Комментарий', time.time()),
+            )
+
+        def worker(kind, operation):
+            connection = self._connect(path, pragmas)
+            cursor = connection.cursor()
+            done = errors = 0
+            start.wait()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                try:
+                    operation(cursor)
+                except sqlite3.OperationalError:
+                    # "database is locked" после истечения ожидания.
+                    errors += 1
+                else:
+                    done += 1
+            connection.close()
+            with lock:
+                totals[kind] += done
+                totals['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=('read', read))
+            for _ in range(readers)
+        ] + [
+            threading.Thread(target=worker, args=('write', write))
+            for _ in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'read': totals['read'] / duration,
+            'write': totals['write'] / duration,
+            'errors': totals['errors'],
+        }
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f'{name:<11} {result["read"]:>10.0f} {result["write"]:>10.0f} '
+            f'{result["errors"]:>8}'
+        )
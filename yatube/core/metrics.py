@@ -0,0 +1,188 @@
+"""Метрики производительности запросов.
+
+MetricsMiddleware замеряет для каждого запроса общее время, число и время
+запросов к базе, время отрисовки шаблонов (без запросов к базе, которые
+выполнили ленивые queryset при отрисовке) и исход кеша страниц, отдаёт их
+персоналу в заголовке Server-Timing и копит по view в гистограммах. View
+metrics выводит гистограммы и счётчики кешей TwoTierCache в текстовом
+формате Prometheus.
+
+Метрики хранятся в памяти процесса: каждый воркер отдаёт свои, а
+суммирует их Prometheus.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import TwoTierCache
+
+_state = threading.local()
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestTimings:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.cache = None
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """execute_wrapper соединения: считает запросы и их время."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def server_timing(self, total):
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        if self.cache is not None:
+            metrics.append(f'cache;desc="{self.cache}"')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+# Имя, описание, границы корзин из настроек и замер из RequestTimings.
+HISTOGRAMS = (
+    ('yatube_request_duration_seconds', 'Время обработки запроса.',
+     'METRICS_LATENCY_BUCKETS', None),
+    ('yatube_request_db_queries', 'Число запросов к базе за запрос.',
+     'METRICS_QUERY_BUCKETS', 'queries'),
+    ('yatube_request_db_duration_seconds', 'Время запросов к базе.',
+     'METRICS_LATENCY_BUCKETS', 'db_time'),
+    ('yatube_request_template_duration_seconds',
+     'Время отрисовки шаблонов без запросов к базе.',
+     'METRICS_LATENCY_BUCKETS', 'template_time'),
+)
+
+_histograms = {}
+_page_cache = defaultdict(int)
+
+
+def start():
+    _state.timings = RequestTimings()
+    return _state.timings
+
+
+def stop():
+    _state.timings = None
+
+
+def current():
+    """Замеры текущего запроса или None вне MetricsMiddleware."""
+    return getattr(_state, 'timings', None)
+
+
+def db_time():
+    """Время запросов к базе с начала текущего запроса."""
+    timings = current()
+    return 0 if timings is None else timings.db_time
+
+
+def add_template_time(seconds):
+    timings = current()
+    if timings is not None:
+        timings.template_time += seconds
+
+
+def note_cache(result):
+    """Исход кеша страниц для текущего запроса: hit, stale, miss,
+    not-modified.
+    """
+    timings = current()
+    if timings is not None:
+        timings.cache = result
+
+
+def observe(view, total, timings):
+    with _lock:
+        for name, _, buckets, attr in HISTOGRAMS:
+            key = (name, view)
+            if key not in _histograms:
+                _histograms[key] = Histogram(getattr(settings, buckets))
+            _histograms[key].observe(
+                total if attr is None else getattr(timings, attr)
+            )
+        if timings.cache is not None:
+            _page_cache[view, timings.cache] += 1
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _page_cache.clear()
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels.items()
+    )
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    lines = []
+    with _lock:
+        for name, description, _, _ in HISTOGRAMS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, view), histogram in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket' + _labels(
+                        view=view, le=_number(bound)
+                    ) + f' {count}')
+                lines.append(f'{name}_bucket' + _labels(
+                    view=view, le='+Inf'
+                ) + f' {histogram.count}')
+                lines.append(
+                    f'{name}_sum{_labels(view=view)} {_number(histogram.sum)}'
+                )
+                lines.append(
+                    f'{name}_count{_labels(view=view)} {histogram.count}'
+                )
+        name = 'yatube_page_cache_requests_total'
+        lines.append(f'# HELP {name} Исходы кеша страниц лент.')
+        lines.append(f'# TYPE {name} counter')
+        for (view, result), count in sorted(_page_cache.items()):
+            lines.append(f'{name}{_labels(view=view, result=result)} {count}')
+    name = 'yatube_two_tier_cache_total'
+    lines.append(f'# HELP {name} Попадания и промахи уровней TwoTierCache.')
+    lines.append(f'# TYPE {name} counter')
+    for cache in sorted(TwoTierCache.instances, key=lambda cache: cache.name):
+        for tier, results in cache.stats().items():
+            for result, count in results.items():
+                lines.append(f'{name}' + _labels(
+                    cache=cache.name, tier=tier, result=result
+                ) + f' {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,76 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, routers
+
+
+class MetricsMiddleware:
+    """Замеряет запрос, отдаёт замеры в Server-Timing и копит их в
+    core.metrics по имени view.
+
+    Server-Timing раскрывает устройство сайта (число запросов, попадания
+    в кеш), поэтому уходит только персоналу или всем при
+    METRICS_SERVER_TIMING = True.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        timings = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.db_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.stop()
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        metrics.observe(
+            match.view_name if match else 'unresolved', total, timings
+        )
+        user = getattr(request, 'user', None)
+        if settings.METRICS_SERVER_TIMING or (user and user.is_staff):
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class ReplicaMiddleware:
+    """Направляет чтения view с replica_reads в реплику и закрепляет
+    пользователя за основной базой после записи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        try:
+            response = self.get_response(request)
+            pin = routers.needs_pin(request)
+        finally:
+            routers.reset()
+        if pin:
+            response.set_cookie(
+                routers.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_LAG,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and getattr(view_func, 'replica_reads', False)
+        ):
+            routers.start_read_only(
+                replica=routers.REPLICA_PIN_COOKIE not in request.COOKIES
+            )
@@ -0,0 +1,91 @@
+"""Чтение из реплик базы для view, которые ничего не пишут.
+
+View, помеченные replica_reads, читают модели приложений
+DATABASE_REPLICA_APPS из одного из псевдонимов DATABASE_REPLICAS, всё
+остальное идёт в default. Реплика может отставать от основной базы,
+поэтому запрос, изменивший данные этих приложений (пост, комментарий,
+подписка), и любой POST ставят пользователю cookie REPLICA_PIN_COOKIE:
+пока она жива (DATABASE_REPLICA_LAG секунд), его чтения идут в основную
+базу и он сразу видит свои изменения. Служебные записи вроде сохранения
+сессии или last_login пользователя не закрепляют, поэтому сессии
+и пользователи всегда читаются из основной базы: сессии, созданной при
+входе, в реплике ещё может не быть.
+
+Решение принимает ReplicaMiddleware и хранит его в локальном для потока
+состоянии, которое читает роутер; потоки вне запроса (пул миниатюр)
+всегда работают с default.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_PIN_COOKIE = 'replica_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_state = threading.local()
+
+
+def replica_reads(view):
+    """Помечает view как читающую из реплики."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return view(request, *args, **kwargs)
+    wrapper.replica_reads = True
+    return wrapper
+
+
+def reset():
+    _state.read_only = False
+    _state.use_replica = False
+    _state.wrote = False
+
+
+def start_read_only(replica=True):
+    """Отмечает запрос к view с replica_reads; replica - читать ли его
+    из реплики.
+    """
+    _state.read_only = True
+    _state.use_replica = replica
+
+
+def reading_replica():
+    """Читает ли текущий запрос из реплики."""
+    return (
+        getattr(_state, 'use_replica', False)
+        and bool(settings.DATABASE_REPLICAS)
+    )
+
+
+def needs_pin(request):
+    """Нужно ли закрепить пользователя за основной базой.
+
+    Записи во время view с replica_reads - служебные (ленивое создание
+    счётчиков), пользователь в них ничего не менял.
+    """
+    if request.method not in SAFE_METHODS:
+        return True
+    return (
+        getattr(_state, 'wrote', False)
+        and not getattr(_state, 'read_only', False)
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            reading_replica()
+            and model._meta.app_label in settings.DATABASE_REPLICA_APPS
+        ):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in settings.DATABASE_REPLICA_APPS:
+            _state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # В репликах те же данные, что и в основной базе.
+        return True
@@ -0,0 +1,89 @@
+"""Сессии в кеше с отложенной записью в базу.
+
+Как и cached_db, движок читает сессию из кеша и обращается к базе только
+при промахе. Изменённая сессия сразу попадает в кеш, а в базу её
+записывает фоновый поток после фиксации транзакции; пока запись не
+выполнена, процесс отдаёт сессию из памяти, даже если кеш её вытеснил.
+Новые сессии пишутся в базу сразу: уникальность ключа проверяет она.
+
+Очередь записей у каждого процесса своя, и соседние воркеры видят
+изменение только через кеш. Если кеш не общий (LocMemCache), они прочли бы
+из базы старую сессию, поэтому тогда изменения пишутся в базу сразу.
+
+    SESSION_ENGINE = 'core.sessions'
+
+При SESSION_WRITE_BEHIND = False изменения пишутся в базу сразу, как
+в cached_db.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import connection, transaction
+
+from .cache import is_shared
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def _write(session_key, data):
+    try:
+        store = SessionStore(session_key)
+        store._session_cache = data
+        DBStore.save(store)
+    except Exception:
+        logger.exception('Не удалось записать сессию %s', session_key)
+    finally:
+        with _lock:
+            if _pending.get(session_key) is data:
+                del _pending[session_key]
+        connection.close()
+
+
+def _submit(session_key, data):
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Один поток: записи одной сессии выполняются по порядку.
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='sessions'
+            )
+    _executor.submit(_write, session_key, data)
+
+
+class SessionStore(cached_db.SessionStore):
+    def load(self):
+        with _lock:
+            data = _pending.get(self.session_key)
+        if data is not None:
+            return dict(data)
+        return super().load()
+
+    def save(self, must_create=False):
+        if (
+            must_create
+            or self.session_key is None
+            or not settings.SESSION_WRITE_BEHIND
+            or not is_shared(self._cache)
+        ):
+            return super().save(must_create)
+        session_key = self.session_key
+        data = dict(self._get_session())
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+        with _lock:
+            _pending[session_key] = data
+        transaction.on_commit(lambda: _submit(session_key, data))
+
+    def delete(self, session_key=None):
+        # Отложенная запись удалённой сессии не пройдёт: строки уже нет,
+        # а обновлять несуществующую сессию DBStore отказывается.
+        with _lock:
+            _pending.pop(session_key or self.session_key, None)
+        super().delete(session_key)
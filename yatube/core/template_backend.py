@@ -0,0 +1,35 @@
+"""Шаблонизатор Django, замеряющий время отрисовки для core.metrics.
+
+Замеряются только шаблоны, отрисованные через бэкенд (render,
+TemplateResponse), поэтому {% include %} не учитывается дважды. Запросы
+к базе, выполненные при отрисовке (ленивые queryset в цикле шаблона),
+уже учтены во времени базы и из времени шаблонов вычитаются.
+"""
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        db_started = metrics.db_time()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.add_template_time(
+                time.perf_counter() - started
+                - (metrics.db_time() - db_started)
+            )
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return InstrumentedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import auth, sessions
+from posts.models import Post, User
+
+CACHE_DIR = tempfile.mkdtemp()
+# Кеш, общий для процессов: с LocMemCache пользователь не кешируется,
+# а сессии пишутся в базу сразу.
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+    },
+}
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedAuthTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_cached_page_without_queries(self):
+        """Страница из кеша отдаётся без запросов к базе и анонимам,
+        и вошедшим пользователям.
+        """
+        url = reverse('posts:index')
+        for client in (Client(), self.authorized_client):
+            with self.subTest(authenticated=client is self.authorized_client):
+                client.get(url)
+                with self.assertNumQueries(0):
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_user_forgotten_on_save(self):
+        """Сохранение пользователя сбрасывает его копию в кеше."""
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(auth.USER_KEY % self.user.pk))
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new-password')
+        user.save()
+        self.assertIsNone(cache.get(auth.USER_KEY % self.user.pk))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_user_not_cached_in_process_cache(self):
+        """С кешем процесса пользователь не кешируется: сброс не дошёл бы
+        до других воркеров.
+        """
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNone(cache.get(auth.USER_KEY % self.user.pk))
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class WriteBehindSessionTests(TestCase):
+    def _session(self):
+        session = sessions.SessionStore()
+        session['value'] = 1
+        session.create()
+        return session
+
+    def test_change_survives_cache_eviction(self):
+        """Пока изменение не записано в базу, сессия читается из памяти
+        процесса, даже если кеш её вытеснил.
+        """
+        session = self._session()
+        session['value'] = 2
+        session.save()
+        cache.clear()
+        self.assertEqual(
+            sessions.SessionStore(session.session_key)['value'], 2
+        )
+
+    def test_change_written_after_commit(self):
+        """После фиксации транзакции изменение попадает в базу."""
+        session = self._session()
+        session['value'] = 2
+        with mock.patch.object(
+            sessions.transaction, 'on_commit', lambda func: func()
+        ), mock.patch.object(
+            sessions, '_submit', sessions._write
+        ), mock.patch.object(sessions.connection, 'close'):
+            session.save()
+        stored = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(stored.get_decoded()['value'], 2)
+        self.assertNotIn(session.session_key, sessions._pending)
+
+    @override_settings(SESSION_WRITE_BEHIND=False)
+    def test_write_through(self):
+        """Без отложенной записи изменение сразу пишется в базу."""
+        session = self._session()
+        session['value'] = 2
+        session.save()
+        stored = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(stored.get_decoded()['value'], 2)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_write_through_with_process_cache(self):
+        """С кешем процесса изменение сразу пишется в базу: другие
+        воркеры не видят ни кеш, ни очередь записи этого процесса.
+        """
+        session = self._session()
+        session['value'] = 2
+        session.save()
+        self.assertNotIn(session.session_key, sessions._pending)
+        stored = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(stored.get_decoded()['value'], 2)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache, TwoTierCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        """Значение сохраняется, читается и удаляется."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertTrue(self.cache.has_key('key'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('key', 'default'), 'default')
+
+    def test_expired_value_not_returned(self):
+        """Просроченная запись не возвращается."""
+        self.cache.set('key', 'value', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_and_incr(self):
+        """add не перезаписывает живой ключ, incr атомарно увеличивает."""
+        self.assertTrue(self.cache.add('key', 1, None))
+        self.assertFalse(self.cache.add('key', 5, None))
+        self.assertEqual(self.cache.incr('key'), 2)
+        self.assertEqual(self.cache.get('key'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_shared_between_instances(self):
+        """Экземпляры с одним файлом (разные процессы) видят общие
+        данные и сброс.
+        """
+        other = SQLiteCache(self.location, {})
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction_by_entries(self):
+        """При превышении MAX_ENTRIES вытесняются давно не читанные."""
+        cache = SQLiteCache(
+            self.location,
+            {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}},
+        )
+        for number in range(3):
+            cache.set(f'key{number}', number)
+        cache._connection.execute(
+            'UPDATE cache SET accessed = 0 WHERE key = ?',
+            (cache.make_key('key1'),),
+        )
+        cache.set('key3', 3)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key3'), 3)
+
+    def test_eviction_by_size(self):
+        """Суммарный размер записей не превышает MAX_SIZE."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_SIZE': 5000}})
+        for number in range(10):
+            cache.set(f'key{number}', b'x' * 1000)
+        size = cache._connection.execute(
+            'SELECT SUM(size) FROM cache'
+        ).fetchone()[0]
+        self.assertLessEqual(size, 5000)
+        self.assertIsNotNone(cache.get('key9'))
+
+    def test_size_bound_with_few_entries(self):
+        """MAX_SIZE соблюдается и когда записей меньше CULL_FREQUENCY."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'MAX_SIZE': 5000, 'MAX_VALUE_SIZE': 5000,
+        }})
+        cache.set('key0', b'x' * 3000)
+        cache.set('key1', b'x' * 3000)
+        size = cache._connection.execute(
+            'SELECT SUM(size) FROM cache'
+        ).fetchone()[0]
+        self.assertLessEqual(size, 5000)
+        self.assertIsNotNone(cache.get('key1'))
+
+    def test_oversized_value_rejected(self):
+        """Значение больше MAX_VALUE_SIZE не кешируется и не вытесняет
+        остальные записи.
+        """
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_SIZE': 5000}})
+        cache.set('small', 1)
+        cache.set('big', 'old')
+        cache.set('big', b'x' * 2000)
+        self.assertIsNone(cache.get('big'))
+        self.assertFalse(cache.add('other', b'x' * 2000))
+        self.assertEqual(cache.get('small'), 1)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tiered = TwoTierCache(max_entries=2, timeout=60)
+
+    def test_local_tier_serves_repeated_reads(self):
+        """Повторное чтение обслуживает LRU процесса, счётчики уровней
+        учитывают попадания и промахи.
+        """
+        cache.set('key', 'value')
+        self.assertEqual(self.tiered.get('key'), 'value')
+        self.assertEqual(self.tiered.get('key'), 'value')
+        self.assertIsNone(self.tiered.get('missing'))
+        self.assertEqual(self.tiered.stats(), {
+            'local': {'hits': 1, 'misses': 2},
+            'shared': {'hits': 1, 'misses': 1},
+        })
+
+    def test_local_tier_bounded(self):
+        """LRU процесса хранит не больше max_entries записей."""
+        for number in range(3):
+            self.tiered.set(f'key{number}', number)
+        cache.clear()
+        self.assertIsNone(self.tiered.get('key0'))
+        self.assertEqual(self.tiered.get('key2'), 2)
+
+    def test_local_tier_expires(self):
+        """Запись LRU процесса живёт не дольше timeout."""
+        tiered = TwoTierCache(timeout=0.01)
+        tiered.set('key', 'value')
+        cache.clear()
+        time.sleep(0.02)
+        self.assertIsNone(tiered.get('key'))
+
+    def test_stale_local_copy_falls_through_to_shared(self):
+        """Локальная копия, не прошедшая is_fresh, перечитывается из
+        общего кеша.
+        """
+        self.tiered.set('key', 1)
+        cache.set('key', 2)
+        self.assertEqual(
+            self.tiered.get('key', is_fresh=lambda value: value == 2), 2
+        )
+        self.assertEqual(self.tiered.get('key'), 2)
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+from django.utils.module_loading import import_string
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _connection(self):
+        """Новое соединение с файлом базы в отдельном каталоге."""
+        settings_dict = dict(
+            connections.databases['default'],
+            NAME=os.path.join(self.directory, 'db.sqlite3'),
+        )
+        wrapper = import_string(
+            settings_dict['ENGINE'] + '.base.DatabaseWrapper'
+        )(settings_dict, alias='sqlite_profile')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def _pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRODUCTION=True)
+    def test_pragmas_applied_to_new_connection(self):
+        """В продакшен-профиле новое соединение получает WAL и прагмы."""
+        connection = self._connection()
+        self.assertEqual(self._pragma(connection, 'journal_mode'), 'wal')
+        # synchronous=NORMAL - 1, temp_store=MEMORY - 2.
+        self.assertEqual(self._pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self._pragma(connection, 'temp_store'), 2)
+        self.assertEqual(self._pragma(connection, 'busy_timeout'), 5000)
+        self.assertEqual(self._pragma(connection, 'cache_size'), -65536)
+
+    @override_settings(SQLITE_PRODUCTION=False)
+    def test_default_profile_untouched(self):
+        """Без продакшен-профиля соединение остаётся с журналом отката."""
+        connection = self._connection()
+        self.assertEqual(self._pragma(connection, 'journal_mode'), 'delete')
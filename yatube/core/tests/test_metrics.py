@@ -0,0 +1,128 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.template import engines
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from posts.models import Post, User
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.staff = User.objects.create_user(username='Staff', is_staff=True)
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        """Ответ содержит время базы и шаблонов и исход кеша страниц."""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertIn('cache;desc="miss"', timing)
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('db;dur=0.0;desc="0 queries"', response['Server-Timing'])
+        self.assertIn('cache;desc="hit"', response['Server-Timing'])
+
+    def test_server_timing_for_staff_only(self):
+        """Без METRICS_SERVER_TIMING заголовок получает только персонал."""
+        authorized_client = Client()
+        authorized_client.force_login(self.user)
+        for client in (self.client, authorized_client):
+            with self.subTest(client=client):
+                response = client.get(reverse('posts:index'))
+                self.assertNotIn('Server-Timing', response)
+        response = self.staff_client.get(reverse('posts:index'))
+        self.assertIn('cache;desc="miss"', response['Server-Timing'])
+
+    def test_not_modified_post_detail_counted(self):
+        """304 post_detail попадает в счётчик исходов кеша страниц."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        content = self.staff_client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'yatube_page_cache_requests_total'
+            '{view="posts:post_detail",result="not-modified"} 1',
+            content,
+        )
+
+    def test_template_time_excludes_queries(self):
+        """Запросы, выполненные при отрисовке шаблона, не входят во время
+        шаблонов.
+        """
+        def slow(execute, sql, params, many, context):
+            time.sleep(0.05)
+            return execute(sql, params, many, context)
+
+        template = engines.all()[0].from_string('{{ users|length }}')
+        timings = metrics.start()
+        try:
+            with connection.execute_wrapper(timings.db_wrapper), \
+                    connection.execute_wrapper(slow):
+                template.render({'users': User.objects.all()})
+        finally:
+            metrics.stop()
+        self.assertEqual(timings.queries, 1)
+        self.assertGreaterEqual(timings.db_time, 0.05)
+        self.assertLess(timings.template_time, 0.05)
+
+    def test_metrics_for_staff_only(self):
+        """Метрики видит только персонал."""
+        authorized_client = Client()
+        authorized_client.force_login(self.user)
+        for client in (self.client, authorized_client):
+            with self.subTest(client=client):
+                response = client.get(reverse('metrics'))
+                self.assertEqual(response.status_code, 403)
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_with_token(self):
+        """Сборщик метрик проходит по токену."""
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong'
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_histograms_per_view(self):
+        """Замеры копятся в гистограммах по view."""
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        content = self.staff_client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            content,
+        )
+        self.assertIn(
+            'yatube_request_db_queries_bucket{view="posts:index",le="+Inf"} 2',
+            content,
+        )
+        self.assertIn(
+            'yatube_page_cache_requests_total'
+            '{view="posts:index",result="hit"} 1',
+            content,
+        )
+        self.assertIn(
+            'yatube_two_tier_cache_total{cache="pages",tier="local",',
+            content,
+        )
@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core import routers
+from posts.models import Post, User
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def _replica_reads(self, url):
+        """Число чтений, направленных роутером в реплику."""
+        with mock.patch.object(
+            routers.random, 'choice', return_value='default'
+        ) as choice:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return choice.call_count
+
+    def test_read_only_views_use_replica(self):
+        """Страницы только для чтения читают из реплики."""
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        ):
+            with self.subTest(url=url):
+                self.assertGreater(self._replica_reads(url), 0)
+
+    def test_other_views_use_primary(self):
+        """Остальные view читают из основной базы."""
+        self.assertEqual(self._replica_reads(reverse('posts:post_create')), 0)
+
+    def test_write_pins_user_to_primary(self):
+        """После подписки пользователь читает из основной базы, пока жива
+        cookie закрепления.
+        """
+        response = self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertIn(routers.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self._replica_reads(reverse('posts:index')), 0)
+
+    def test_router_outside_request(self):
+        """Вне запроса чтения идут в основную базу."""
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(Post))
+
+    def test_service_writes_do_not_pin(self):
+        """Сохранение сессии и last_login не закрепляет пользователя,
+        запись постов и любой POST - закрепляют.
+        """
+        router = routers.ReplicaRouter()
+        get = RequestFactory().get('/')
+        routers.reset()
+        router.db_for_write(Session)
+        router.db_for_write(User)
+        self.assertFalse(routers.needs_pin(get))
+        self.assertTrue(routers.needs_pin(RequestFactory().post('/')))
+        router.db_for_write(Post)
+        self.assertTrue(routers.needs_pin(get))
+        routers.reset()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaDatabaseTests(TestCase):
+    """Чтения с настоящей второй базой: в реплике другие данные, чем
+    в основной, поэтому по странице видно, откуда она прочитана.
+    """
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases['replica'] = dict(
+            connections.databases['default'],
+            NAME='file:replica?mode=memory&cache=shared',
+            TEST={},
+        )
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+        author = User.objects.create_user(username='Author')
+        Post.objects.create(author=author, text='Пост в основной базе')
+        replica_author = User.objects.db_manager('replica').create_user(
+            username='Author'
+        )
+        Post.objects.using('replica').create(
+            author=replica_author, text='Пост в реплике'
+        )
+        cls.user = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.get(author=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].connection.close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_reads_from_replica_until_post(self):
+        """Лента читается из реплики, а после POST пользователя - из
+        основной базы, пока жива cookie закрепления. Сессии и пользователи
+        всегда читаются из основной базы.
+        """
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertContains(response, 'Пост в реплике')
+        # Сессия и пользователь читаются из основной базы.
+        self.assertTrue(response.context['user'].is_authenticated)
+        self.assertNotIn(routers.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'},
+        )
+        self.assertIn(routers.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.get(url)
+        self.assertContains(response, 'Пост в основной базе')
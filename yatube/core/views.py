@@ -1,6 +1,12 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics as performance
 
 
 def permission_denied(request, exception):
@@ -26,3 +32,19 @@ def server_error(request):
         'core/500.html',
         status=HTTPStatus.INTERNAL_SERVER_ERROR
     )
+
+
+def metrics(request):
+    """Метрики процесса в формате Prometheus: для персонала или для
+    сборщика с токеном METRICS_TOKEN в заголовке Authorization.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = token and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    )
+    if not (authorized or request.user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(
+        performance.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
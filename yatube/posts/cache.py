@@ -0,0 +1,252 @@
+"""Кеш страниц лент с версионированием по поколениям.
+
+У каждой ленты (главная, группа, профиль) есть счётчик-поколение, который
+хранится вместе с закешированной страницей. Сигналы изменения постов,
+комментариев и подписок увеличивают поколение, поэтому страницы можно
+хранить без срока жизни: страница другого поколения считается устаревшей.
+ETag строится по содержимому страницы и хранится вместе с ней, так что
+повторный запрос браузера или прокси с If-None-Match получает 304 без
+обращения к базе, а любая пересборка с другим содержимым меняет ETag.
+"""
+import math
+import random
+import time
+from collections import namedtuple
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from core import metrics
+from core.cache import TwoTierCache
+from core.routers import reading_replica
+
+GENERATION_KEY = 'posts:generation:%s'
+PAGE_KEY = 'posts:page:%s:%s:%s'
+LOCK_POLL_INTERVAL = 0.05
+
+# Страницы читаются из LRU процесса, а поколения - всегда из общего кеша:
+# по ним другие процессы узнают о сбросе.
+pages = TwoTierCache(
+    max_entries=settings.POSTS_LOCAL_CACHE_MAX_ENTRIES,
+    timeout=settings.POSTS_LOCAL_CACHE_TIMEOUT,
+    name='pages',
+)
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+def commenters_scope():
+    """Имена авторов комментариев на страницах постов: поколение одно
+    на все посты, потому что имена меняют редко.
+    """
+    return 'commenters'
+
+
+def generation(scope):
+    key = GENERATION_KEY % scope
+    value = cache.get(key)
+    if value is None:
+        # Поколение могло быть вытеснено из кеша: новое значение от времени
+        # не совпадёт ни с одним из уже использованных.
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def _increment(scopes):
+    for scope in scopes:
+        key = GENERATION_KEY % scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(*scopes):
+    """Сбрасывает кеш страниц перечисленных лент.
+
+    Поколение увеличивается сразу и ещё раз после фиксации транзакции,
+    чтобы страница, собранная по незафиксированным данным, не осталась
+    в кеше.
+    """
+    _increment(scopes)
+    transaction.on_commit(lambda: _increment(scopes))
+
+
+def page_key(request, scope):
+    path = md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY % (scope, request.user.pk or 0, path)
+
+
+def make_etag(*parts):
+    return '"%s"' % md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def page_etag(key, content):
+    return make_etag(key, md5(content).hexdigest())
+
+
+def set_validators(request, response, etag):
+    """ETag и Cache-Control, требующий проверять страницу при каждом
+    показе; страницы вошедших пользователей общий кеш хранить не должен.
+    """
+    response['ETag'] = etag
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+class CachedPage(namedtuple(
+    'CachedPage',
+    'generation refresh_at delta content content_type etag',
+)):
+    """Страница в кеше вместе с поколением, на котором она собрана."""
+
+    def is_fresh(self, generation):
+        if self.generation != generation:
+            return False
+        if self.refresh_at is None:
+            return True
+        # Вероятностное раннее обновление (XFetch): чем ближе срок и чем
+        # дольше страница собиралась, тем вероятнее один из запросов
+        # пересоберёт её заранее, пока остальные получают текущую копию.
+        early = -self.delta * settings.POSTS_CACHE_EARLY_REFRESH_BETA * (
+            math.log(1 - random.random())
+        )
+        return time.time() + early < self.refresh_at
+
+    def response(self, request, result):
+        """Страница или 304, если у клиента уже есть это содержимое."""
+        not_modified = get_conditional_response(request, etag=self.etag)
+        if not_modified is not None:
+            metrics.note_cache('not-modified')
+            return set_validators(request, not_modified, self.etag)
+        metrics.note_cache(result)
+        return set_validators(
+            request,
+            HttpResponse(self.content, content_type=self.content_type),
+            self.etag,
+        )
+
+
+def _render(view, request, args, kwargs, key, generation):
+    started = time.monotonic()
+    response = view(request, *args, **kwargs)
+    if response.status_code != 200:
+        return response
+    etag = page_etag(key, response.content)
+    set_validators(request, response, etag)
+    soft_timeout = settings.POSTS_CACHE_SOFT_TIMEOUT
+    refresh_at = None if soft_timeout is None else time.time() + soft_timeout
+    if reading_replica():
+        # Реплика могла ещё не получить изменения, сбросившие поколение:
+        # такую страницу пересобираем, когда реплика догонит основную базу.
+        lag_over = time.time() + settings.DATABASE_REPLICA_LAG
+        refresh_at = lag_over if refresh_at is None else min(
+            refresh_at, lag_over
+        )
+    pages.set(
+        key,
+        CachedPage(
+            generation=generation,
+            refresh_at=refresh_at,
+            delta=time.monotonic() - started,
+            content=response.content,
+            content_type=response['Content-Type'],
+            etag=etag,
+        ),
+        settings.POSTS_CACHE_TIMEOUT,
+    )
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def conditional_page(etag_func):
+    """Отвечает 304 на GET, если If-None-Match совпадает с ETag.
+
+    etag_func получает запрос и именованные аргументы view и возвращает
+    части ETag (или None, если проверять нечего, например нет объекта).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            parts = etag_func(request, **kwargs)
+            if parts is None:
+                return view(request, *args, **kwargs)
+            etag = make_etag(*parts)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            else:
+                metrics.note_cache('not-modified')
+            return set_validators(request, response, etag)
+        return wrapper
+    return decorator
+
+
+def versioned_cache_page(scope):
+    """Кеширует GET-ответ view до смены поколения ленты.
+
+    scope получает именованные аргументы view и возвращает имя ленты.
+    Устаревшую страницу пересобирает один запрос, взявший блокировку,
+    остальные в это время получают устаревшую копию (stale-while-
+    revalidate) или, если копии нет, недолго ждут результата.
+
+    ETag страницы строится по её содержимому и сверяется с If-None-Match
+    у той копии, которая была бы отдана: свежей, устаревшей или только
+    что собранной.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            name = scope(**kwargs)
+            key = page_key(request, name)
+            current = generation(name)
+
+            def is_fresh(page):
+                return page.is_fresh(current)
+
+            page = pages.get(key, is_fresh=is_fresh)
+            if page is not None and is_fresh(page):
+                return page.response(request, 'hit')
+            lock = key + ':lock'
+            if cache.add(lock, 1, settings.POSTS_CACHE_LOCK_TIMEOUT):
+                metrics.note_cache('miss')
+                try:
+                    return _render(view, request, args, kwargs, key, current)
+                finally:
+                    cache.delete(lock)
+            if page is not None:
+                return page.response(request, 'stale')
+            deadline = time.monotonic() + settings.POSTS_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                page = pages.shared.get(key)
+                if page is not None and page.generation == current:
+                    return page.response(request, 'hit')
+            metrics.note_cache('miss')
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,2 +1,5 @@
 stringLength = 15
-cacheTime = 20
+thumbnailSize = (1280, 840)
+thumbnailWidths = (320, 640, 960, 1280)
+thumbnailFormats = ('WEBP', 'JPEG')
+thumbnailOptions = {'crop': 'center', 'upscale': True, 'quality': 80}
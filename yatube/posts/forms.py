@@ -1,5 +1,6 @@
 from django.forms import ModelForm
 
+from . import thumbnails
 from .models import Comment, Post
 
 
@@ -10,6 +11,12 @@ class PostForm(ModelForm):
         help_texts = {'group': 'Выберите группу', 'text': 'Введите ссообщение'}
         fields = ('group', 'text', 'image')
 
+    def save(self, commit=True):
+        post = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            thumbnails.schedule(post.image.name)
+        return post
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,138 @@
+"""Обработка загруженных изображений постов.
+
+При загрузке картинка нормализуется: поворот по EXIF применяется,
+метаданные отбрасываются, слишком большие изображения уменьшаются,
+и всё перекодируется с заданным качеством. Размеры, объём и хеш
+содержимого сохраняются в модели, чтобы при показе страниц не открывать
+файл изображения.
+
+Уменьшить растр при декодировании умеет только JPEG, остальные форматы
+декодируются целиком, поэтому картинки, растр которых больше
+POSTS_IMAGE_MAX_PIXELS, не принимаются.
+"""
+import hashlib
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+HASH_CHUNK_SIZE = 64 * 2 ** 10
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def draft(source):
+    """Просит JPEG декодироваться сразу в уменьшенном масштабе; остальные
+    форматы draft() не поддерживают.
+    """
+    max_size = settings.POSTS_IMAGE_MAX_SIZE
+    # Поворот по EXIF может поменять стороны местами.
+    source.draft('RGB', (max(max_size), max(max_size)))
+
+
+def check_pixels(source):
+    """ValidationError, если декодированный растр source будет больше
+    POSTS_IMAGE_MAX_PIXELS.
+    """
+    width, height = source.size
+    limit = settings.POSTS_IMAGE_MAX_PIXELS
+    if width * height > limit:
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s, допустимо '
+            'не больше %(limit)s пикселей.',
+            code='image_too_large',
+            params={'width': width, 'height': height, 'limit': limit},
+        )
+
+
+def validate_pixels(file):
+    """Валидатор поля картинки: размеры читаются из заголовка, растр
+    не декодируется. Уже сохранённые картинки проверены при загрузке.
+    """
+    if getattr(file, '_committed', False):
+        return
+    file.seek(0)
+    try:
+        with Image.open(file) as source:
+            draft(source)
+            check_pixels(source)
+    except (OSError, Image.DecompressionBombError):
+        # Нечитаемый файл отклоняет само ImageField.
+        pass
+    finally:
+        file.seek(0)
+
+
+def normalize(file):
+    """Нормализованная копия картинки (File) или None, если её нужно
+    сохранить как есть (анимация).
+
+    Pillow читает файл лениво, а JPEG через draft() декодируется сразу
+    в уменьшенном масштабе, поэтому в памяти не оказывается полноразмерный
+    растр большой фотографии; растр других форматов ограничен
+    POSTS_IMAGE_MAX_PIXELS (ValidationError, если он больше). Результат
+    пишется во временный файл, который уходит на диск после
+    POSTS_IMAGE_SPOOL_SIZE байт.
+    """
+    max_size = settings.POSTS_IMAGE_MAX_SIZE
+    file.seek(0)
+    with Image.open(file) as source:
+        if getattr(source, 'is_animated', False):
+            file.seek(0)
+            return None
+        draft(source)
+        check_pixels(source)
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail(max_size, Image.LANCZOS)
+    if has_alpha(image):
+        image_format = 'PNG'
+        image = image.convert('RGBA')
+        options = {'optimize': True}
+    else:
+        image_format = 'JPEG'
+        image = image.convert('RGB')
+        options = {
+            'quality': settings.POSTS_IMAGE_QUALITY,
+            'optimize': True,
+            'progressive': True,
+        }
+    output = SpooledTemporaryFile(max_size=settings.POSTS_IMAGE_SPOOL_SIZE)
+    # EXIF и прочие метаданные не передаются; цветовой профиль сохраняется.
+    image.save(
+        output, image_format,
+        icc_profile=image.info.get('icc_profile'), **options
+    )
+    output.seek(0)
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return File(output, name=name + EXTENSIONS[image_format])
+
+
+def describe(file):
+    """Ширина, высота, размер в байтах и SHA-256 содержимого файла.
+
+    Файл читается по частям; Pillow для размеров читает только заголовок.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': size,
+        'image_hash': digest.hexdigest(),
+    }
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+FIELDS = ('image_width', 'image_height', 'image_size', 'image_hash')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, объём и хеш картинок постов, загруженных '
+        'до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Сколько постов обновлять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(
+            image_hash=''
+        ).only('pk', 'image').order_by('pk')
+        last_pk = 0
+        updated = 0
+        missing = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = []
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file:
+                        post.set_image_metadata(**images.describe(file))
+                except (OSError, ValueError):
+                    missing += 1
+                    continue
+                changed.append(post)
+            # bulk_update не трогает edited, поэтому кеш карточек остаётся.
+            Post.objects.bulk_update(changed, FIELDS)
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено постов: {updated}, файлов не удалось прочитать: '
+            f'{missing}.'
+        ))
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import media
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов, на которые не ссылается ни один пост, '
+        'наборы их миниатюр и файлы миниатюр, забытые хранилищем ключей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов или записей проверять одним запросом.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.POSTS_MEDIA_GRACE_PERIOD,
+            help=(
+                'Не трогать файлы моложе стольких секунд: их пост может '
+                'быть ещё не сохранён.'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы удалено.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        min_age = options['min_age']
+        dry_run = options['dry_run']
+
+        images = 0
+        for name in media.orphaned_images(min_age, batch_size):
+            images += 1
+            if dry_run:
+                self.stdout.write(name)
+            else:
+                media.remove(name)
+
+        thumbnail_sets = media.clean_thumbnail_sets(batch_size, dry_run)
+
+        thumbnail_files = 0
+        for name in media.orphaned_thumbnail_files(min_age, batch_size):
+            thumbnail_files += 1
+            if dry_run:
+                self.stdout.write(name)
+            else:
+                default.storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено картинок: {images}, наборов миниатюр: '
+            f'{thumbnail_sets}, файлов миниатюр без записей: '
+            f'{thumbnail_files}.'
+        ))
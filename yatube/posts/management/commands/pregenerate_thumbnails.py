@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры изображений постов.'
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct()
+        created = 0
+        ready = 0
+        for name in names.iterator():
+            if thumbnails.ready(name) is not None:
+                ready += 1
+                continue
+            thumbnails.generate(name)
+            created += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {created}, уже были готовы: {ready}.'
+        ))
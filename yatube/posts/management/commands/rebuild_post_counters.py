@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Group, Post, PostCounter
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов лент и удаляет счётчики удалённых '
+        'групп. Недостающие счётчики создаются при первом показе ленты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить счётчики с данными, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        actual = {PostCounter.index_scope(): Post.objects.count()}
+        groups = Group.objects.order_by().annotate(
+            posts_total=Count('posts')
+        ).values_list('pk', 'posts_total')
+        for group_id, posts_total in groups:
+            actual[PostCounter.group_scope(group_id)] = posts_total
+        checked = mismatched = 0
+        with transaction.atomic():
+            for counter in PostCounter.objects.select_for_update():
+                checked += 1
+                count = actual.get(counter.scope)
+                if count == counter.count:
+                    continue
+                mismatched += 1
+                self.stdout.write(
+                    f'{counter.scope}: {counter.count} -> '
+                    f'{"нет ленты" if count is None else count}'
+                )
+                if options['verify']:
+                    continue
+                if count is None:
+                    counter.delete()
+                else:
+                    counter.count = count
+                    counter.save(update_fields=['count'])
+        if options['verify'] and mismatched:
+            raise CommandError(
+                f'Расхождения в {mismatched} из {checked} счётчиков постов.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено счётчиков: {checked}, исправлено: '
+            f'{0 if options["verify"] else mismatched}.'
+        ))
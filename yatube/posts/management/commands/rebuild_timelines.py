@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново заполняет материализованные ленты подписок. Ленты '
+        'пересобираются по одной в своей транзакции, так что остальные '
+        'читатели всё это время видят свои ленты целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько читателей выбирать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        readers = (
+            Follow.objects
+            .order_by('user_id')
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        batch_size = options['batch_size']
+        last_user_id = 0
+        total = 0
+        while True:
+            user_ids = list(
+                readers.filter(user_id__gt=last_user_id)[:batch_size]
+            )
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+            for user_id in user_ids:
+                self._rebuild(user_id)
+            total += len(user_ids)
+        # Записи читателей, у которых не осталось подписок.
+        TimelineEntry.objects.filter(user__follower__isnull=True).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {total}, '
+            f'записей в лентах: {TimelineEntry.objects.count()}.'
+        ))
+
+    def _rebuild(self, user_id):
+        follows = Follow.objects.filter(user_id=user_id).select_related(
+            'author'
+        )
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id=user_id).delete()
+            for follow in follows:
+                timeline.backfill(follow)
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Follow, Post, User, UserStats
+
+
+def count_of(model, field):
+    rows = (
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и подписок пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить счётчики с данными, ничего не меняя.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей обрабатывать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk').annotate(
+            posts_total=count_of(Post, 'author'),
+            followers_total=count_of(Follow, 'author'),
+            following_total=count_of(Follow, 'user'),
+        )
+        last_pk = 0
+        checked = mismatched = 0
+        while True:
+            batch = list(
+                users.filter(pk__gt=last_pk)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            existing = UserStats.objects.in_bulk([user.pk for user in batch])
+            with transaction.atomic():
+                for user in batch:
+                    checked += 1
+                    actual = {
+                        'posts_count': user.posts_total,
+                        'followers_count': user.followers_total,
+                        'following_count': user.following_total,
+                    }
+                    stats = existing.get(user.pk)
+                    if stats is None and options['verify']:
+                        continue
+                    if stats is not None and all(
+                        getattr(stats, field) == value
+                        for field, value in actual.items()
+                    ):
+                        continue
+                    if stats is not None:
+                        mismatched += 1
+                        self.stdout.write(
+                            f'{user.username}: '
+                            f'{stats.posts_count}/{stats.followers_count}/'
+                            f'{stats.following_count} -> '
+                            f'{user.posts_total}/{user.followers_total}/'
+                            f'{user.following_total}'
+                        )
+                    if not options['verify']:
+                        UserStats.objects.update_or_create(
+                            user=user, defaults=actual
+                        )
+        if options['verify'] and mismatched:
+            raise CommandError(
+                f'Расхождения в счётчиках у {mismatched} из {checked} '
+                f'пользователей.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено пользователей: {checked}, исправлено: '
+            f'{0 if options["verify"] else mismatched}.'
+        ))
@@ -0,0 +1,166 @@
+"""Удаление картинок постов и миниатюр, на которые больше не ссылаются.
+
+Сигналы освобождают старую картинку, когда её заменяют при
+редактировании поста или удаляют пост. Всё, что они пропустили (файлы
+моложе POSTS_MEDIA_GRACE_PERIOD, сбои, записи из старых версий),
+подбирает команда gc_media: она обходит каталог картинок, хранилище
+ключей sorl и каталог миниатюр порциями, не загружая их целиком.
+"""
+import posixpath
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import thumbnails
+from .models import Post
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def walk(storage, path):
+    """Имена всех файлов в каталоге path хранилища, рекурсивно."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in sorted(files):
+        yield posixpath.join(path, name)
+    for directory in sorted(directories):
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def referenced(names):
+    """Те из имён, на которые ссылается хотя бы один пост."""
+    return set(
+        Post.objects.filter(image__in=names).order_by()
+        .values_list('image', flat=True)
+    )
+
+
+def is_recent(storage, name, min_age):
+    try:
+        modified = storage.get_modified_time(name)
+    except FileNotFoundError:
+        return False
+    return modified > timezone.now() - timedelta(seconds=min_age)
+
+
+def remove(name):
+    """Удаляет картинку вместе с её миниатюрами."""
+    thumbnails.delete(name)
+    image_storage().delete(name)
+
+
+def release(name):
+    """Удаляет картинку name, если на неё больше не ссылаются посты.
+
+    Недавно записанный файл мог только что понадобиться новому посту
+    с такой же картинкой (хранилище адресует файлы по содержимому), поэтому
+    файлы моложе POSTS_MEDIA_GRACE_PERIOD остаются для gc_media.
+    """
+    if not name or name in referenced([name]):
+        return False
+    if is_recent(image_storage(), name, settings.POSTS_MEDIA_GRACE_PERIOD):
+        return False
+    remove(name)
+    return True
+
+
+def orphaned_images(min_age, batch_size):
+    """Картинки без ссылок из постов, не менявшиеся min_age секунд."""
+    storage = image_storage()
+    root = Post._meta.get_field('image').upload_to.rstrip('/')
+    for batch in batches(walk(storage, root), batch_size):
+        used = referenced(batch)
+        for name in batch:
+            if name not in used and not is_recent(storage, name, min_age):
+                yield name
+
+
+def kvstore_rows(identity, batch_size):
+    """Записи хранилища ключей sorl с данным типом, порциями по ключу."""
+    prefix = add_prefix('', identity)
+    rows = KVStoreModel.objects.filter(key__startswith=prefix).order_by('key')
+    last_key = ''
+    while True:
+        batch = list(rows.filter(key__gt=last_key)[:batch_size])
+        if not batch:
+            return
+        last_key = batch[-1].key
+        yield batch
+
+
+def clean_thumbnail_sets(batch_size, dry_run=False):
+    """Удаляет наборы миниатюр, исходники которых не использует ни один
+    пост. Возвращает число удалённых наборов.
+
+    Если пост с такой картинкой всё же появится, шаблон заново поставит
+    миниатюры в очередь.
+    """
+    if not isinstance(default.kvstore, CachedDBStore):
+        # Обходить порциями умеем только хранилище ключей в базе.
+        return 0
+    deleted = 0
+    for batch in kvstore_rows('thumbnails', batch_size):
+        keys = [del_prefix(row.key) for row in batch]
+        sources = {
+            del_prefix(row.key): deserialize_image_file(row.value)
+            for row in KVStoreModel.objects.filter(
+                key__in=[add_prefix(key) for key in keys]
+            )
+        }
+        used = referenced([source.name for source in sources.values()])
+        for key in keys:
+            source = sources.get(key)
+            if source is not None and source.name in used:
+                continue
+            deleted += 1
+            if dry_run:
+                continue
+            if source is None:
+                # Исходника в хранилище нет: удаляем то, что известно
+                # по списку миниатюр.
+                default.kvstore.delete_thumbnails(SimpleNamespace(key=key))
+            else:
+                default.kvstore.delete(source)
+                cache.delete(thumbnails.picture_key(source.name))
+    return deleted
+
+
+def orphaned_thumbnail_files(min_age, batch_size):
+    """Файлы в каталоге миниатюр, о которых не знает хранилище ключей."""
+    storage = default.storage
+    root = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+    for batch in batches(walk(storage, root), batch_size):
+        keys = {
+            name: add_prefix(ImageFile(name, storage).key) for name in batch
+        }
+        known = set(
+            KVStoreModel.objects.filter(
+                key__in=keys.values()
+            ).values_list('key', flat=True)
+        )
+        for name, key in keys.items():
+            if key not in known and not is_recent(storage, name, min_age):
+                yield name
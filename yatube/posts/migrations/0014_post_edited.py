@@ -0,0 +1,26 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def edited_from_pub_date(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(edited=models.F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='edited',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения поста'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(edited_from_pub_date, migrations.RunPython.noop),
+    ]
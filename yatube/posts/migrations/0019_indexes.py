@@ -0,0 +1,55 @@
+# Generated by Django 2.2.19 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = Follow.objects.values('user', 'author').annotate(
+        first=models.Min('pk'), total=models.Count('pk')
+    ).filter(total__gt=1)
+    users = set()
+    for row in duplicates:
+        Follow.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(pk=row['first']).delete()
+        users.update((row['user'], row['author']))
+    # Лишние подписки учитывались в счётчиках: пересчитываем их.
+    for stats in UserStats.objects.filter(user__in=users):
+        stats.following_count = Follow.objects.filter(
+            user=stats.user_id
+        ).count()
+        stats.followers_count = Follow.objects.filter(
+            author=stats.user_id
+        ).count()
+        stats.save(update_fields=['following_count', 'followers_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_postcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='post_group_date_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.19 on 2026-10-18 08:30
+
+from django.db import migrations, models
+import posts.images
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_image_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', validators=[posts.images.validate_pixels], verbose_name='Картинка'),
+        ),
+    ]
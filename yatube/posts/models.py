@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, F
+from django.db.models.query import ModelIterable
 
+from . import images
 from .constants import stringLength as sl
+from .storage import ContentAddressedStorage
 
 
 User = get_user_model()
@@ -32,6 +37,40 @@ class Group(models.Model):
         return self.title
 
 
+class FeedIterable(ModelIterable):
+    """Посты вместе с числом комментариев, посчитанным одним
+    сгруппированным запросом на всю выборку.
+    """
+
+    def __iter__(self):
+        posts = list(super().__iter__())
+        if posts:
+            counts = dict(
+                Comment.objects
+                .filter(post__in=posts)
+                .order_by()
+                .values_list('post')
+                .annotate(Count('pk'))
+            )
+            for post in posts:
+                post.comments_count = counts.get(post.pk, 0)
+        return iter(posts)
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для лент: автор и группа одним JOIN, число комментариев
+        отдельным запросом на страницу, чтобы карточка поста не делала
+        запросов к БД.
+
+        Число комментариев не аннотируется подзапросом: с ним COUNT(*)
+        пагинатора превращается в GROUP BY по всей таблице.
+        """
+        queryset = self.select_related('author', 'group')
+        queryset._iterable_class = FeedIterable
+        return queryset
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст',
@@ -43,6 +82,10 @@ class Post(models.Model):
         verbose_name='Дата публикации поста',
         db_index=True
     )
+    edited = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения поста',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -61,20 +104,84 @@ class Post(models.Model):
             'Группа, к которой будет относиться пост (необязательное поле)'
         ),
     )
+    # Индекс для поиска постов по картинке: освобождение файлов, gc_media
+    # и сброс лент после создания миниатюры.
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True,
+        validators=[images.validate_pixels],
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
         blank=True,
+        editable=False,
     )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер картинки в байтах',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_hash = models.CharField(
+        'SHA-256 картинки',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты автора и группы: отбор и порядок по одному индексу. Индекс
+        # SQLite неявно заканчивается rowid по возрастанию, поэтому поля
+        # тоже по возрастанию: обратный проход даёт (-pub_date, -id),
+        # прямой - порядок для курсора «назад».
+        indexes = [
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:sl]
 
+    def save(self, *args, **kwargs):
+        # Сведения о картинке обновляются только при загрузке нового файла:
+        # уже сохранённый файл при каждом сохранении поста не читается.
+        if not self.image:
+            self.set_image_metadata(
+                image_width=None, image_height=None, image_size=None,
+                image_hash='',
+            )
+        elif not self.image._committed:
+            if settings.POSTS_IMAGE_NORMALIZE:
+                normalized = images.normalize(self.image)
+                if normalized is not None:
+                    self.image = normalized
+            self.set_image_metadata(**images.describe(self.image))
+        super().save(*args, **kwargs)
+
+    def set_image_metadata(self, **metadata):
+        for field, value in metadata.items():
+            setattr(self, field, value)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -104,6 +211,11 @@ class Comment(models.Model):
         ordering = ('created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:sl]
@@ -123,6 +235,161 @@ class Follow(models.Model):
 
     class Meta:
         verbose_name = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:sl]
+
+
+class UserStatsQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Счётчики пользователя; при отсутствии записи она создаётся
+        по фактическим данным.
+        """
+        try:
+            return self.get(user=user)
+        except UserStats.DoesNotExist:
+            stats, _ = self.get_or_create(
+                user=user, defaults=UserStats.calculate(user)
+            )
+            return stats
+
+    def change(self, user_id, **deltas):
+        """Атомарно сдвигает счётчики пользователя на заданные значения."""
+        self.filter(user_id=user_id).update(**{
+            field: F(field) + delta for field, delta in deltas.items()
+        })
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.IntegerField(
+        default=0,
+        verbose_name='Постов',
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        verbose_name='Подписчиков',
+    )
+    following_count = models.IntegerField(
+        default=0,
+        verbose_name='Подписок',
+    )
+
+    objects = UserStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+    @staticmethod
+    def calculate(user):
+        return {
+            'posts_count': Post.objects.filter(author=user).count(),
+            'followers_count': Follow.objects.filter(author=user).count(),
+            'following_count': Follow.objects.filter(user=user).count(),
+        }
+
+
+class PostCounterQuerySet(models.QuerySet):
+    def value(self, scope, queryset):
+        """Число постов в ленте scope; при отсутствии счётчика он
+        создаётся по queryset.count().
+        """
+        try:
+            return self.get(scope=scope).count
+        except PostCounter.DoesNotExist:
+            counter, _ = self.get_or_create(
+                scope=scope, defaults={'count': queryset.count()}
+            )
+            return counter.count
+
+    def change(self, scope, delta):
+        """Атомарно сдвигает счётчик, если он уже создан."""
+        self.filter(scope=scope).update(count=F('count') + delta)
+
+
+class PostCounter(models.Model):
+    """Число постов в ленте (всей или группы) для пагинации без COUNT(*).
+
+    Поддерживается сигналами сохранения и удаления постов.
+    """
+
+    scope = models.CharField(
+        max_length=100,
+        primary_key=True,
+        verbose_name='Лента',
+    )
+    count = models.IntegerField(
+        default=0,
+        verbose_name='Постов',
+    )
+
+    objects = PostCounterQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Счётчик постов'
+        verbose_name_plural = 'Счётчики постов'
+
+    def __str__(self):
+        return self.scope
+
+    @staticmethod
+    def index_scope():
+        return 'index'
+
+    @staticmethod
+    def group_scope(group_id):
+        return f'group:{group_id}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста',
+    )
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            # Обратный проход даёт порядок ленты (-pub_date, -post),
+            # прямой - обратный для ссылок «назад».
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_date_post_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <- {self.post}'
@@ -0,0 +1,204 @@
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+PAGE_RANGE_ON_EACH_SIDE = 2
+PAGE_RANGE_ON_ENDS = 1
+
+
+def elided_page_range(page, on_each_side=PAGE_RANGE_ON_EACH_SIDE,
+                      on_ends=PAGE_RANGE_ON_ENDS):
+    """Номера страниц для навигации: первые и последние on_ends страниц
+    и on_each_side соседей текущей; пропуски обозначены None.
+
+    Число ссылок не зависит от количества страниц.
+    """
+    number = page.number
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(range(1, num_pages + 1))
+    pages = []
+    if number > 1 + on_each_side + on_ends + 1:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(None)
+        pages.extend(range(number - on_each_side, number + 1))
+    else:
+        pages.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        pages.extend(range(number + 1, number + on_each_side + 1))
+        pages.append(None)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(number + 1, num_pages + 1))
+    return pages
+
+
+def seek(ordering, values, backwards=False):
+    """Условие «строго после записи со значениями values» в порядке
+    ordering (при backwards - «строго до»).
+    """
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        descending = name.startswith('-') != backwards
+        lookup = '%s__%s' % (
+            name.lstrip('-'), 'lt' if descending else 'gt'
+        )
+        condition |= equal & Q(**{lookup: value})
+        equal &= Q(**{name.lstrip('-'): value})
+    return condition
+
+
+class CountedPaginator(Paginator):
+    """Paginator, берущий число записей из поддерживаемого счётчика.
+
+    total - функция, возвращающая значение счётчика. Точный COUNT(*)
+    выполняется, только если счётчик не больше exact_threshold: на малых
+    выборках он дёшев, а небольшое расхождение там заметнее.
+    """
+
+    def __init__(self, object_list, per_page, total, exact_threshold,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.total = total
+        self.exact_threshold = exact_threshold
+
+    @cached_property
+    def count(self):
+        total = self.total()
+        if total <= self.exact_threshold:
+            return Paginator.count.func(self)
+        return total
+
+
+class CursorPage(Sequence):
+    """Страница ленты без общего количества записей и номера страницы."""
+
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по полям сортировки модели.
+
+    Вместо OFFSET и COUNT(*) страница выбирается условием
+    «строго после/до последней показанной записи», поэтому стоимость
+    запроса не зависит от глубины страницы. Положение в ленте передаётся
+    непрозрачным токеном ?after= или ?before=.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        model = object_list.model
+        if ordering is None:
+            ordering = tuple(model._meta.ordering)
+            last = ordering[-1] if ordering else 'pk'
+            ordering += ('-pk' if last.startswith('-') else 'pk',)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            model._meta.pk if name.lstrip('-') == 'pk'
+            else model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+
+    def encode(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        return urlsafe_base64_encode(force_bytes(json.dumps(values)))
+
+    def decode(self, token):
+        """Возвращает значения полей из токена или None, если он испорчен
+        или в нём есть пустые значения.
+        """
+        if not token:
+            return None
+        try:
+            values = json.loads(urlsafe_base64_decode(token).decode())
+            if len(values) != len(self.fields):
+                return None
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            return None
+        # Поля сортировки не бывают NULL, а сравнение с None не строится.
+        if any(value is None for value in values):
+            return None
+        return values
+
+    def _seek(self, values, backwards):
+        return seek(self.ordering, values, backwards)
+
+    def _order(self, backwards):
+        if not backwards:
+            return self.ordering
+        return tuple(
+            name[1:] if name.startswith('-') else '-' + name
+            for name in self.ordering
+        )
+
+    def _fetch(self, position, backwards, limit):
+        """Первые limit записей после position (до неё при backwards)
+        в порядке обхода.
+        """
+        queryset = self.object_list.order_by(*self._order(backwards))
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, backwards))
+        return list(queryset[:limit])
+
+    def get_page(self, after=None, before=None):
+        """Страница после токена after, до токена before или первая."""
+        position = self.decode(before or after)
+        backwards = bool(before) and position is not None
+        items = self._fetch(position, backwards, self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            if not items:
+                return self.get_page()
+            items.reverse()
+            return CursorPage(
+                items, self,
+                next_cursor=self.encode(items[-1]),
+                previous_cursor=self.encode(items[0]) if has_more else None,
+            )
+        if position is not None and not items:
+            return CursorPage(items, self, previous_cursor=after)
+        return CursorPage(
+            items, self,
+            next_cursor=self.encode(items[-1]) if has_more else None,
+            previous_cursor=(
+                self.encode(items[0]) if position is not None else None
+            ),
+        )
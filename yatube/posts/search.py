@@ -0,0 +1,125 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite используется индекс FTS5 (таблица posts_post_fts, rowid = id
+поста), который сигналы обновляют при сохранении и удалении поста;
+результаты упорядочены по релевантности (bm25). Для других СУБД есть
+запасной бэкенд на icontains. Бэкенд задаётся POSTS_SEARCH_BACKEND
+(путь к классу) или выбирается по типу базы.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class DatabaseSearchBackend:
+    """Поиск подстрок средствами ORM, без индекса и ранжирования."""
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def filter(self, queryset, query):
+        for term in terms(query):
+            queryset = queryset.filter(text__icontains=term)
+        return queryset
+
+    def search(self, query):
+        if not terms(query):
+            return Post.objects.none()
+        return self.filter(Post.objects.feed(), query)
+
+
+class SearchResults:
+    """Ранжированные результаты FTS-запроса для Paginator: count() и срезы
+    выполняются отдельными запросами с LIMIT/OFFSET к индексу.
+    """
+
+    def __init__(self, match):
+        self.match = match
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.match],
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [self.match, index.stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+class SQLiteFTSBackend:
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def match(self, query):
+        # Каждое слово - отдельная фраза с поиском по префиксу, так что
+        # спецсимволы запроса не ломают синтаксис FTS5.
+        return ' '.join(f'"{term}"*' for term in terms(query))
+
+    def filter(self, queryset, query):
+        if not terms(query):
+            return queryset.none()
+        # RawSQL в pk__in SQLite читает как список из одного подзапроса
+        # ("IN ((SELECT ...))") и берёт только первую строку.
+        return queryset.extra(
+            where=[
+                f'"{Post._meta.db_table}"."id" IN (SELECT rowid '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[self.match(query)],
+        )
+
+    def search(self, query):
+        if not terms(query):
+            return []
+        return SearchResults(self.match(query))
+
+
+def get_backend():
+    if settings.POSTS_SEARCH_BACKEND:
+        return import_string(settings.POSTS_SEARCH_BACKEND)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
@@ -0,0 +1,290 @@
+import threading
+
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models import DEFERRED, Count
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import cache, media, timeline
+from .search import get_backend as search_backend
+from .models import (Comment, Follow, Group, Post, PostCounter, User,
+                     UserStats)
+
+# Поля, которые ленты показывают рядом с постами.
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_DISPLAY_FIELDS = ('title', 'slug', 'description')
+
+# Посты и авторы, удаляемые сейчас в этом потоке. Каскад сначала шлёт
+# pre_delete всем объектам, затем удаляет комментарии, посты и авторов:
+# ленты и счётчики обновляются один раз на удаляемый пост или автора,
+# а не на каждый попавший под каскад комментарий и пост.
+_deleting = threading.local()
+
+
+def deleting(name):
+    if not hasattr(_deleting, name):
+        setattr(_deleting, name, set())
+    return getattr(_deleting, name)
+
+
+@receiver(request_started)
+def forget_deleting(**kwargs):
+    # Если удаление откатилось, post_delete не пришёл и не убрал отметки.
+    _deleting.__dict__.clear()
+
+
+def display_values(instance, fields):
+    # Как и _loaded_group_id, из __dict__: отложенные поля не загружаем.
+    return tuple(instance.__dict__.get(name, DEFERRED) for name in fields)
+
+
+def invalidate_post_pages(post):
+    group_ids = {post.group_id, getattr(post, '_loaded_group_id', None)}
+    slugs = Group.objects.filter(
+        pk__in=group_ids - {None, DEFERRED}
+    ).values_list('slug', flat=True)
+    cache.bump(
+        cache.index_scope(),
+        cache.profile_scope(post.author.username),
+        *(cache.group_scope(slug) for slug in slugs)
+    )
+
+
+def image_name(post):
+    """Имя сохранённой картинки поста или None, если оно неизвестно.
+
+    Значение берётся из __dict__, чтобы не загружать отложенное поле;
+    у ещё не сохранённого файла имени в хранилище нет.
+    """
+    image = post.__dict__.get('image')
+    if isinstance(image, str):
+        return image
+    if isinstance(image, FieldFile) and image._committed:
+        return image.name
+    return None
+
+
+def release_image(name):
+    if name:
+        transaction.on_commit(lambda: media.release(name))
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Отложенные поля не читаем: это стоило бы запроса на каждый объект.
+    instance._loaded_group_id = instance.__dict__.get('group_id', DEFERRED)
+    instance._loaded_image = image_name(instance)
+
+
+def count_post(group_id, delta, with_index=True):
+    if with_index:
+        PostCounter.objects.change(PostCounter.index_scope(), delta)
+    if group_id is not None:
+        PostCounter.objects.change(PostCounter.group_scope(group_id), delta)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.change(instance.author_id, posts_count=1)
+        count_post(instance.group_id, 1)
+        timeline.fan_out(instance)
+    elif instance._loaded_group_id not in (DEFERRED, instance.group_id):
+        count_post(instance._loaded_group_id, -1, with_index=False)
+        count_post(instance.group_id, 1, with_index=False)
+    search_backend().index(instance)
+    invalidate_post_pages(instance)
+    instance._loaded_group_id = instance.group_id
+    loaded_image = getattr(instance, '_loaded_image', None)
+    instance._loaded_image = image_name(instance)
+    if loaded_image != instance._loaded_image:
+        release_image(loaded_image)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting('posts').add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting('posts').discard(instance.pk)
+    search_backend().remove(instance.pk)
+    release_image(image_name(instance))
+    if instance.author_id in deleting('authors'):
+        return
+    UserStats.objects.change(instance.author_id, posts_count=-1)
+    count_post(instance.group_id, -1)
+    invalidate_post_pages(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    """Посты удаляемой группы остаются без неё (UPDATE без сигналов
+    постов): сбрасываем ленты, где была ссылка на группу.
+    """
+    usernames = User.objects.filter(
+        posts__group=instance
+    ).distinct().values_list('username', flat=True)
+    cache.bump(
+        cache.index_scope(),
+        cache.group_scope(instance.slug),
+        *(cache.profile_scope(username) for username in usernames)
+    )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    PostCounter.objects.filter(
+        scope=PostCounter.group_scope(instance.pk)
+    ).delete()
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """Посты и комментарии пользователя удаляются каскадом: счётчики
+    и ленты обновляются здесь одним проходом, а сигналы его постов
+    и комментариев это пропускают.
+    """
+    deleting('authors').add(instance.pk)
+    groups = dict(
+        Post.objects.filter(author=instance).order_by()
+        .values_list('group_id').annotate(count=Count('pk'))
+    )
+    posts_total = sum(groups.values())
+    if posts_total:
+        PostCounter.objects.change(PostCounter.index_scope(), -posts_total)
+    for group_id, count in groups.items():
+        if group_id is not None:
+            PostCounter.objects.change(
+                PostCounter.group_scope(group_id), -count
+            )
+    slugs = set(Group.objects.filter(
+        pk__in=groups.keys() - {None}
+    ).values_list('slug', flat=True))
+    # Счётчики комментариев под чужими постами.
+    usernames = set()
+    commented = Post.objects.filter(
+        comments__author=instance
+    ).exclude(author=instance).values_list('author__username', 'group__slug')
+    for username, slug in commented.distinct():
+        usernames.add(username)
+        if slug is not None:
+            slugs.add(slug)
+    cache.bump(
+        cache.index_scope(),
+        cache.profile_scope(instance.username),
+        *(cache.profile_scope(username) for username in usernames),
+        *(cache.group_scope(slug) for slug in slugs)
+    )
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    deleting('authors').discard(instance.pk)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._loaded_display = display_values(instance, USER_DISPLAY_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Имя автора есть в лентах, где он писал: при его смене страницы
+    этих лент сбрасываются. Вход (last_login) их не трогает.
+    """
+    loaded = instance._loaded_display
+    instance._loaded_display = display_values(instance, USER_DISPLAY_FIELDS)
+    if created or loaded == instance._loaded_display:
+        return
+    old_username = loaded[0]
+    slugs = Group.objects.filter(
+        posts__author=instance
+    ).distinct().values_list('slug', flat=True)
+    commented = Comment.objects.filter(author=instance).exists()
+    cache.bump(
+        cache.index_scope(),
+        cache.profile_scope(instance.username),
+        *(
+            [cache.profile_scope(old_username)]
+            if old_username not in (DEFERRED, instance.username) else []
+        ),
+        *(cache.group_scope(slug) for slug in slugs),
+        *([cache.commenters_scope()] if commented else [])
+    )
+
+
+@receiver(post_init, sender=Group)
+def group_loaded(sender, instance, **kwargs):
+    instance._loaded_display = display_values(
+        instance, GROUP_DISPLAY_FIELDS
+    )
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    """Название группы есть в лентах с её постами."""
+    loaded = instance._loaded_display
+    instance._loaded_display = display_values(
+        instance, GROUP_DISPLAY_FIELDS
+    )
+    if created or loaded == instance._loaded_display:
+        return
+    old_slug = loaded[1]
+    usernames = User.objects.filter(
+        posts__group=instance
+    ).distinct().values_list('username', flat=True)
+    cache.bump(
+        cache.index_scope(),
+        cache.group_scope(instance.slug),
+        *(
+            [cache.group_scope(old_slug)]
+            if old_slug not in (DEFERRED, instance.slug) else []
+        ),
+        *(cache.profile_scope(username) for username in usernames)
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_post_pages(instance.post)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Ленты сбросит удаляемый вместе с комментарием пост или автор.
+    if (
+        instance.post_id in deleting('posts')
+        or instance.author_id in deleting('authors')
+    ):
+        return
+    invalidate_post_pages(instance.post)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.change(instance.author_id, followers_count=1)
+        UserStats.objects.change(instance.user_id, following_count=1)
+        timeline.backfill(instance)
+        cache.bump(
+            cache.profile_scope(instance.author.username),
+            cache.profile_scope(instance.user.username),
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    UserStats.objects.change(instance.author_id, followers_count=-1)
+    UserStats.objects.change(instance.user_id, following_count=-1)
+    timeline.remove(instance)
+    timeline.follower_lost(instance.author_id)
+    cache.bump(
+        cache.profile_scope(instance.author.username),
+        cache.profile_scope(instance.user.username),
+    )
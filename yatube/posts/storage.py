@@ -0,0 +1,41 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 содержимого
+(posts/ab/cd/abcd....jpg), поэтому одинаковые картинки, загруженные
+повторно, ссылаются на один оригинал и, так как sorl строит миниатюры по
+имени исходника, на один набор миниатюр. Число ссылок на файл - число
+постов с этим именем в базе; файлы без ссылок удаляет команда gc_media.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .images import HASH_CHUNK_SIZE
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4],
+            digest + extension,
+        )
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения защищает файл, на который снова
+            # сослались, от gc_media с --min-age.
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
@@ -0,0 +1,20 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image):
+    """Готовые варианты миниатюры (posts.thumbnails.Picture) или None.
+
+    Если миниатюры ещё нет, её создание ставится в очередь, а шаблон
+    показывает оригинал.
+    """
+    if not image:
+        return None
+    thumbnail = thumbnails.ready(image.name)
+    if thumbnail is None:
+        thumbnails.schedule(image.name)
+    return thumbnail
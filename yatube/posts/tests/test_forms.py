@@ -1,10 +1,12 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Post, User
 
@@ -110,6 +112,43 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.author.username,
                          self.post.author.username)
 
+    def _image(self, size, image_format):
+        buffer = BytesIO()
+        Image.new('RGBA' if image_format == 'PNG' else 'RGB', size).save(
+            buffer, image_format
+        )
+        return SimpleUploadedFile(
+            name='big.' + image_format.lower(), content=buffer.getvalue()
+        )
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=100 * 100)
+    def test_image_over_pixel_limit_rejected(self):
+        '''PNG, растр которого больше лимита, не принимается.'''
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая картинка',
+                  'image': self._image((200, 100), 'PNG')},
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertEqual(
+            response.context['form'].errors.as_data()['image'][0].code,
+            'image_too_large',
+        )
+
+    @override_settings(
+        POSTS_IMAGE_MAX_PIXELS=100 * 100, POSTS_IMAGE_MAX_SIZE=(50, 50)
+    )
+    def test_jpeg_over_pixel_limit_decoded_in_draft(self):
+        '''JPEG декодируется в уменьшенном масштабе и проходит лимит.'''
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большое фото',
+                  'image': self._image((400, 400), 'JPEG')},
+        )
+        post = Post.objects.get(text='Большое фото')
+        self.assertEqual((post.image_width, post.image_height), (50, 50))
+
     def test_new_comment_created_in_database(self):
         '''Проверка создания комментария в базе данных.'''
         comment_count = Comment.objects.count()
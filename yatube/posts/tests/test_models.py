@@ -1,6 +1,24 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-from posts.models import Comment, Group, Post, User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import (Comment, Follow, Group, Post, PostCounter, User,
+                          UserStats)
 from ..constants import stringLength as sl
 
 
@@ -152,3 +170,425 @@ class PostModelTests(TestCase):
                     expected_value,
                     'help_text модели Post не совпадает с ожидаемым'
                 )
+
+
+class UserStatsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.follower = User.objects.create_user(username='Follower')
+        Post.objects.create(author=cls.author, text='Тестовое поле поста')
+
+    def _stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_stats_created_from_actual_data(self):
+        """Запись счётчиков создаётся по фактическим данным."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        stats = UserStats.objects.for_user(self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(stats.following_count, 0)
+
+    def test_stats_follow_posts_and_follows(self):
+        """Счётчики меняются при создании и удалении постов и подписок."""
+        UserStats.objects.for_user(self.author)
+        UserStats.objects.for_user(self.follower)
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Ещё пост')
+        self.assertEqual(self._stats(self.author).posts_count, 2)
+        self.assertEqual(self._stats(self.author).followers_count, 1)
+        self.assertEqual(self._stats(self.follower).following_count, 1)
+        follow.delete()
+        post.delete()
+        self.assertEqual(self._stats(self.author).posts_count, 1)
+        self.assertEqual(self._stats(self.author).followers_count, 0)
+        self.assertEqual(self._stats(self.follower).following_count, 0)
+
+    @override_settings(POSTS_EXACT_COUNT_THRESHOLD=0)
+    def test_profile_without_count_queries(self):
+        """Когда запись счётчиков есть, for_user читает её одним запросом,
+        а профиль не выполняет COUNT(*).
+        """
+        UserStats.objects.for_user(self.author)
+        with self.assertNumQueries(1):
+            UserStats.objects.for_user(self.author)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:profile', kwargs={'username': self.author})
+            )
+        self.assertEqual(response.context['stats'].posts_count, 1)
+        for query in queries.captured_queries:
+            self.assertNotIn('SELECT COUNT(*)', query['sql'])
+
+    def test_rebuild_user_stats_command(self):
+        """Команда rebuild_user_stats находит и исправляет расхождения."""
+        UserStats.objects.for_user(self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_user_stats', verify=True, stdout=StringIO())
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertEqual(self._stats(self.author).posts_count, 1)
+        self.assertEqual(self._stats(self.follower).following_count, 0)
+        call_command('rebuild_user_stats', verify=True, stdout=StringIO())
+
+
+class PostCounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {n}', slug=f'group{n}')
+            for n in range(2)
+        ]
+        Post.objects.create(author=cls.user, text='Пост', group=cls.groups[0])
+
+    def _counts(self):
+        return [
+            PostCounter.objects.value(PostCounter.index_scope(), Post.objects),
+            *(
+                PostCounter.objects.value(
+                    PostCounter.group_scope(group.pk), group.posts.all()
+                )
+                for group in self.groups
+            ),
+        ]
+
+    def test_counters_follow_posts(self):
+        """Счётчики создаются по данным и следуют за созданием, переносом
+        в другую группу и удалением постов.
+        """
+        self.assertEqual(self._counts(), [1, 1, 0])
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.groups[0]
+        )
+        self.assertEqual(self._counts(), [2, 2, 0])
+        post.group = self.groups[1]
+        post.save()
+        self.assertEqual(self._counts(), [2, 1, 1])
+        Post.objects.get(pk=post.pk).delete()
+        self.assertEqual(self._counts(), [1, 1, 0])
+
+    def test_counters_follow_user_delete(self):
+        """Удаление автора уменьшает счётчики на все его посты."""
+        author = User.objects.create_user(username='Author')
+        for _ in range(3):
+            Post.objects.create(
+                author=author, text='Пост', group=self.groups[0]
+            )
+        self.assertEqual(self._counts(), [4, 4, 0])
+        author.delete()
+        self.assertEqual(self._counts(), [1, 1, 0])
+
+    def test_cascade_delete_queries_do_not_grow(self):
+        """Число запросов при удалении поста и автора не зависит от числа
+        комментариев и постов.
+        """
+        def delete_queries(posts, comments):
+            author = User.objects.create_user(username=f'Author{posts}')
+            for _ in range(posts):
+                post = Post.objects.create(
+                    author=author, text='Пост', group=self.groups[0]
+                )
+                for _ in range(comments):
+                    Comment.objects.create(
+                        post=post, author=self.user, text='Комментарий'
+                    )
+            post = Post.objects.get(pk=post.pk)
+            with CaptureQueriesContext(connection) as post_queries:
+                post.delete()
+            author = User.objects.get(pk=author.pk)
+            with CaptureQueriesContext(connection) as user_queries:
+                author.delete()
+            # Из поискового индекса посты удаляются по одному.
+            return (
+                len(post_queries),
+                len(user_queries) - (posts - 1),
+            )
+
+        self.assertEqual(delete_queries(2, 1), delete_queries(5, 10))
+
+    def test_counter_removed_with_group(self):
+        """Счётчик удаляется вместе с группой."""
+        group = Group.objects.get(pk=self.groups[1].pk)
+        self._counts()
+        group.delete()
+        self.assertFalse(PostCounter.objects.filter(
+            scope=PostCounter.group_scope(group.pk)
+        ).exists())
+
+    def test_rebuild_post_counters_command(self):
+        """Команда rebuild_post_counters находит и исправляет расхождения
+        и удаляет счётчики лент, которых больше нет.
+        """
+        self._counts()
+        PostCounter.objects.filter(
+            scope=PostCounter.group_scope(self.groups[0].pk)
+        ).update(count=7)
+        PostCounter.objects.create(scope=PostCounter.group_scope(0), count=3)
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_post_counters', verify=True, stdout=StringIO()
+            )
+        call_command('rebuild_post_counters', stdout=StringIO())
+        self.assertEqual(self._counts(), [1, 1, 0])
+        self.assertFalse(PostCounter.objects.filter(
+            scope=PostCounter.group_scope(0)
+        ).exists())
+        call_command('rebuild_post_counters', verify=True, stdout=StringIO())
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageMetadataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        buffer = BytesIO()
+        Image.new('RGB', (30, 10), 'blue').save(buffer, 'PNG')
+        cls.content = buffer.getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def _post(self):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('photo.png', self.content, 'image/png'),
+        )
+
+    def _metadata(self, post):
+        return (
+            post.image_width, post.image_height, post.image_size,
+            post.image_hash,
+        )
+
+    def test_metadata_saved_on_upload(self):
+        """Размеры, объём и хеш картинки сохраняются при загрузке."""
+        post = Post.objects.get(pk=self._post().pk)
+        with post.image.open('rb') as file:
+            stored = file.read()
+        self.assertEqual(self._metadata(post), (
+            30, 10, len(stored), hashlib.sha256(stored).hexdigest(),
+        ))
+        post.image = ''
+        post.save()
+        self.assertEqual(self._metadata(post), (None, None, None, ''))
+
+    def test_backfill_image_metadata_command(self):
+        """Команда заполняет сведения о картинках старых постов."""
+        post = self._post()
+        expected = self._metadata(post)
+        Post.objects.update(
+            image_width=None, image_height=None, image_size=None,
+            image_hash='',
+        )
+        call_command(
+            'backfill_image_metadata', batch_size=1, stdout=StringIO()
+        )
+        post.refresh_from_db()
+        self.assertEqual(self._metadata(post), expected)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageNormalizationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def _upload(self, image, image_format, name, **params):
+        buffer = BytesIO()
+        image.save(buffer, image_format, **params)
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name, buffer.getvalue()),
+        )
+        return Post.objects.get(pk=post.pk)
+
+    def test_orientation_applied_and_metadata_stripped(self):
+        """Поворот по EXIF применяется, а сами метаданные не сохраняются."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        post = self._upload(
+            Image.new('RGB', (40, 20)), 'JPEG', 'photo.jpeg',
+            exif=exif.tobytes(),
+        )
+        self.assertEqual((post.image_width, post.image_height), (20, 40))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POSTS_IMAGE_MAX_SIZE=(16, 16))
+    def test_large_image_downscaled(self):
+        """Картинка больше POSTS_IMAGE_MAX_SIZE уменьшается с сохранением
+        пропорций; прозрачность остаётся в PNG.
+        """
+        post = self._upload(
+            Image.new('RGBA', (40, 20)), 'PNG', 'picture.gif'
+        )
+        self.assertEqual((post.image_width, post.image_height), (16, 8))
+        self.assertTrue(post.image.name.endswith('.png'))
+
+    def test_animation_kept_as_uploaded(self):
+        """Анимированные картинки сохраняются без перекодирования."""
+        frames = [Image.new('RGB', (4, 4), color) for color in ('red', 'blue')]
+        buffer = BytesIO()
+        frames[0].save(
+            buffer, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        post = self._upload(
+            frames[0], 'GIF', 'animation.gif', save_all=True,
+            append_images=frames[1:],
+        )
+        self.assertEqual(post.image_size, len(buffer.getvalue()))
+        self.assertTrue(post.image.name.endswith('.gif'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def _post(self, color, name='photo.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name, buffer.getvalue()),
+        )
+
+    def test_duplicates_share_one_file(self):
+        """Одинаковые картинки хранятся одним файлом с именем по хешу."""
+        first = self._post('red', 'first.png')
+        second = self._post('red', 'second.png')
+        other = self._post('green')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertIn(first.image_hash, first.image.name)
+        self.assertTrue(first.image.name.startswith(
+            f'posts/{first.image_hash[:2]}/{first.image_hash[2:4]}/'
+        ))
+
+    def test_gc_media_removes_unreferenced_files(self):
+        """gc_media удаляет только файлы, на которые не ссылаются посты."""
+        shared = self._post('red')
+        duplicate = self._post('red')
+        orphan = self._post('blue')
+        storage = orphan.image.storage
+        duplicate.delete()
+        orphan.delete()
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertTrue(storage.exists(shared.image.name))
+        self.assertFalse(storage.exists(orphan.image.name))
+
+    def test_gc_media_keeps_recent_files(self):
+        """Недавно записанные файлы gc_media не трогает."""
+        post = self._post('blue')
+        post.delete()
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_MEDIA_GRACE_PERIOD=0)
+@mock.patch('posts.signals.transaction.on_commit', lambda func: func())
+class MediaCleanupTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def _upload(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue())
+
+    def _post(self, color):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self._upload(color)
+        )
+        return Post.objects.get(pk=post.pk)
+
+    def _thumbnail_names(self, name):
+        picture = thumbnails.generate(name)
+        return [
+            url.split(' ')[0][len(settings.MEDIA_URL):]
+            for srcset in (picture.srcset, *dict(picture.sources).values())
+            for url in srcset.split(', ')
+        ]
+
+    def test_replaced_image_removed_with_thumbnails(self):
+        """Заменённая картинка удаляется вместе с миниатюрами."""
+        post = self._post('red')
+        old = post.image.name
+        names = self._thumbnail_names(old)
+        self.assertTrue(all(default.storage.exists(name) for name in names))
+        post.image = self._upload('blue')
+        post.save()
+        storage = post.image.storage
+        self.assertFalse(storage.exists(old))
+        self.assertFalse(any(default.storage.exists(name) for name in names))
+        self.assertIsNone(thumbnails.ready(old))
+        self.assertTrue(storage.exists(post.image.name))
+
+    def test_shared_image_kept_until_last_post_deleted(self):
+        """Общая картинка удаляется только вместе с последним постом."""
+        first = self._post('green')
+        second = self._post('green')
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_editing_text_keeps_image(self):
+        """Сохранение поста без замены картинки её не трогает."""
+        post = self._post('yellow')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_gc_media_cleans_thumbnail_store(self):
+        """gc_media удаляет наборы миниатюр картинок без постов и файлы
+        миниатюр, о которых не знает хранилище ключей.
+        """
+        post = self._post('purple')
+        names = self._thumbnail_names(post.image.name)
+        Post.objects.filter(pk=post.pk).update(image='')
+        stray = default.storage.save(
+            'cache/ff/ff/stray.jpg', self._upload('black')
+        )
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertFalse(any(default.storage.exists(name) for name in names))
+        self.assertFalse(default.storage.exists(stray))
+        self.assertFalse(post.image.storage.exists(post.image.name))
@@ -0,0 +1,133 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import media, thumbnails
+from posts.models import Comment, Follow, Group, Post, User
+
+# Любой проход по таблице или индексу целиком, кроме виртуальной таблицы
+# FTS: "SCAN ... USING INDEX" тоже читает всё, если нет LIMIT.
+SCAN = re.compile(r'^SCAN (?!.*\bVIRTUAL TABLE\b)')
+# Вся лента (главная) читается проходом по индексу даты до LIMIT, а её
+# COUNT(*) - проходом по самому узкому индексу.
+FEED_SCAN = re.compile(r'^SCAN posts_post USING (COVERING )?INDEX ')
+TEMP_BTREE = 'USE TEMP B-TREE'
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц не должны читать таблицы целиком или сортировать
+    результат во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='t_slug'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = None
+        for number in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author,
+                text=f'Пост про котиков номер {number}',
+                group=cls.group if number % 2 else None,
+            )
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text='Комментарий'
+            )
+        cls.index_urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+        )
+        cls.feed_urls = (
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.author}),
+            reverse('posts:follow_index'),
+        )
+        cls.urls = cls.feed_urls + (
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': cls.post.pk}),
+            reverse('posts:search') + '?q=котик',
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _assert_indexed(self, url, allowed_scan=None):
+        """Каждый SELECT страницы ищет по индексу (SEARCH), а не проходит
+        таблицу, и не сортирует во временном B-дереве.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self._check_plans(queries, allowed_scan)
+        return response
+
+    def _check_plans(self, queries, allowed_scan=None):
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            for step in self._plan(sql):
+                if allowed_scan is None or not allowed_scan.match(step):
+                    self.assertIsNone(SCAN.match(step), f'{step}\n{sql}')
+                self.assertNotIn(TEMP_BTREE, step, sql)
+
+    def _cursor_urls(self, url):
+        """Первая, следующая и предыдущая страницы ленты по курсорам."""
+        page = self.client.get(url).context['page_obj']
+        self.assertTrue(page.has_next(), url)
+        next_url = f'{url}?after={page.next_cursor}'
+        page = self.client.get(next_url).context['page_obj']
+        return (url, next_url, f'{url}?before={page.previous_cursor}')
+
+    def test_views_use_indexes(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self._assert_indexed(url)
+        for url in self.index_urls:
+            with self.subTest(url=url):
+                self._assert_indexed(url, FEED_SCAN)
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_follow_feed_with_read_time_authors(self):
+        """Посты авторов, подмешанные при чтении, тоже ищутся по индексу."""
+        url = reverse('posts:follow_index')
+        response = self._assert_indexed(url)
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self._assert_indexed(url + '?page=2')
+        with self.settings(POSTS_PAGINATION='cursor'):
+            for page_url in self._cursor_urls(url):
+                with self.subTest(url=page_url):
+                    self._assert_indexed(page_url)
+
+    @override_settings(POSTS_PAGINATION='cursor', POSTS_NUMBER=3)
+    def test_cursor_pages_use_indexes(self):
+        for url in self.feed_urls:
+            for page_url in self._cursor_urls(url):
+                with self.subTest(url=page_url):
+                    self._assert_indexed(page_url)
+        for page_url in self._cursor_urls(self.index_urls[0]):
+            with self.subTest(url=page_url):
+                self._assert_indexed(page_url, FEED_SCAN)
+
+    def test_image_lookups_use_index(self):
+        """Поиск постов по имени картинки идёт по индексу."""
+        with CaptureQueriesContext(connection) as queries:
+            media.referenced(['posts/a.jpg', 'posts/b.jpg'])
+            thumbnails._invalidate_pages('posts/a.jpg')
+        self._check_plans(queries)
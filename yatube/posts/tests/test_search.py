@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.weak = Post.objects.create(
+            author=cls.user,
+            text='Пост про котиков и немного про собак',
+        )
+        cls.strong = Post.objects.create(
+            author=cls.user,
+            text='Котики, котики и ещё раз котики',
+        )
+        cls.other = Post.objects.create(
+            author=cls.user,
+            text='Пост про погоду',
+        )
+        cls.url_search = reverse('posts:search')
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def _found(self, query):
+        response = self.guest_client.get(self.url_search, {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_returns_ranked_matches(self):
+        """Поиск находит посты по префиксу слова и ранжирует их."""
+        self.assertEqual(self._found('котик'), [self.strong, self.weak])
+        self.assertEqual(self._found('пост погоду'), [self.other])
+
+    def test_search_index_follows_post_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        post = Post.objects.get(pk=self.other.pk)
+        post.text = 'Пост про котиков в дождь'
+        post.save()
+        self.assertIn(post, self._found('дождь'))
+        post.delete()
+        self.assertEqual(self._found('дождь'), [])
+
+    def test_search_special_characters(self):
+        """Спецсимволы FTS в запросе не приводят к ошибке."""
+        for query in ('"', 'котик*', 'NOT (', '***'):
+            with self.subTest(query=query):
+                response = self.guest_client.get(
+                    self.url_search, {'q': query}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_search_paginated(self):
+        """Результаты поиска разбиты на страницы."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Пост про котиков')
+            for _ in range(settings.POSTS_NUMBER)
+        ])
+        for post in Post.objects.all():
+            post.save()
+        self.assertEqual(len(self._found('котиков')), settings.POSTS_NUMBER)
+        response = self.guest_client.get(
+            self.url_search, {'q': 'котиков', 'page': 2}
+        )
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%82')
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке использует полнотекстовый индекс."""
+        model_admin = site._registry[Post]
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, _ = model_admin.get_search_results(
+            request, Post.objects.all(), 'котик'
+        )
+        self.assertEqual(set(queryset), {self.strong, self.weak})
@@ -0,0 +1,119 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_file(name='photo.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 20), 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_original_shown_until_thumbnail_ready(self):
+        """Пока миниатюры нет, страница показывает оригинал, а после
+        её создания - миниатюру.
+        """
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=image_file()
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertIsNone(thumbnails.ready(post.image.name))
+        response = self.authorized_client.get(url)
+        self.assertContains(response, post.image.url)
+
+        picture = thumbnails.generate(post.image.name)
+        self.assertEqual(thumbnails.ready(post.image.name), picture)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, picture.url)
+        self.assertNotContains(response, post.image.url)
+
+    def test_cached_feed_shows_thumbnail_when_ready(self):
+        """Лента, закешированная с оригиналом, показывает миниатюру, как
+        только та готова.
+        """
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=image_file()
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.assertContains(self.authorized_client.get(url),
+                                post.image.url)
+        picture = thumbnails.generate(post.image.name)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, picture.url)
+                self.assertNotContains(response, post.image.url)
+
+    def test_picture_variants(self):
+        """Для изображения готовятся все ширины в WebP и JPEG, шаблон
+        выводит их в srcset с размерами и ленивой загрузкой.
+        """
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=image_file()
+        )
+        picture = thumbnails.generate(post.image.name)
+        self.assertEqual((picture.width, picture.height), (1280, 840))
+        for width in (320, 640, 960, 1280):
+            self.assertIn(f'.jpg {width}w', picture.srcset)
+        (mime_type, srcset), = picture.sources
+        self.assertEqual(mime_type, 'image/webp')
+        self.assertEqual(srcset.count('.webp '), 4)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, f'srcset="{srcset}"')
+        self.assertContains(response, 'width="1280" height="840"')
+        self.assertContains(response, 'loading="lazy"')
+
+    @override_settings(POSTS_THUMBNAILS_ASYNC=False)
+    def test_thumbnail_prepared_when_form_saved(self):
+        """Миниатюра готовится при сохранении поста через форму."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image_file()},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertTrue(post.image)
+        self.assertIsNotNone(thumbnails.ready(post.image.name))
+
+    def test_pregenerate_command(self):
+        """Команда создаёт миниатюры для уже загруженных изображений."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=image_file()
+        )
+        call_command('pregenerate_thumbnails', stdout=StringIO())
+        self.assertIsNotNone(thumbnails.ready(post.image.name))
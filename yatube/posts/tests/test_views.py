@@ -1,16 +1,25 @@
 import datetime
 import shutil
 import tempfile
+from io import StringIO
 from math import ceil
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
 
-from posts.models import Follow, Group, Post, User
+from posts.cache import GENERATION_KEY, index_scope, page_key
+from posts.models import (Comment, Follow, Group, Post, PostCounter,
+                          TimelineEntry, User, UserStats)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -62,6 +71,49 @@ class PaginatorTest(TestCase):
         n = value % settings.POSTS_NUMBER
         return n
 
+    @override_settings(POSTS_NUMBER=1)
+    def test_page_range_elided(self):
+        """Навигация показывает первую и последнюю страницы и соседей
+        текущей, остальные номера заменены многоточием.
+        """
+        response = self.guest_client.get(self.url_index + '?page=7')
+        self.assertEqual(
+            response.context['page_obj'].elided_page_range,
+            [1, None, 5, 6, 7, 8, 9, None, 14],
+        )
+        self.assertEqual(response.content.decode().count('page-item'), 13)
+        response = self.guest_client.get(self.url_index)
+        self.assertEqual(
+            response.context['page_obj'].elided_page_range,
+            [1, 2, 3, None, 14],
+        )
+
+    @override_settings(POSTS_EXACT_COUNT_THRESHOLD=5)
+    def test_large_feeds_counted_from_counters(self):
+        """Выше порога число постов берётся из счётчиков без COUNT(*)."""
+        PostCounter.objects.value(PostCounter.index_scope(), Post.objects)
+        PostCounter.objects.filter(
+            scope=PostCounter.index_scope()
+        ).update(count=1000)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.url_index)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1000)
+        for query in queries.captured_queries:
+            self.assertNotIn('SELECT COUNT(*)', query['sql'])
+
+    @override_settings(POSTS_EXACT_COUNT_THRESHOLD=100)
+    def test_small_feeds_counted_exactly(self):
+        """Не выше порога число постов считается точно."""
+        PostCounter.objects.value(PostCounter.index_scope(), Post.objects)
+        PostCounter.objects.filter(
+            scope=PostCounter.index_scope()
+        ).update(count=50)
+        response = self.guest_client.get(self.url_index)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            Post.objects.count(),
+        )
+
     def test_index_group_profile_pages_contain_N_posts(self):
         """Проверяет количество постов на первой и второй странице
         по адресам index, group_list и profile.
@@ -110,6 +162,186 @@ class PaginatorTest(TestCase):
                 )
 
 
+@override_settings(POSTS_PAGINATION='cursor')
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы',
+            slug='t_slug',
+            description='Тестовое описание группы',
+        )
+        Post.objects.bulk_create([
+            Post(
+                author=cls.user,
+                text=f'Тестовый пост {number}',
+                group=cls.group
+            )
+            for number in range(settings.POSTS_NUMBER + 4)
+        ])
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_cursor_pages_follow_post_ordering(self):
+        """Страницы по токенам after/before идут в порядке Post.Meta.ordering
+        без пропусков и повторов.
+        """
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url).context['page_obj']
+                self.assertFalse(first.has_previous())
+                self.assertTrue(first.has_next())
+                second = self.guest_client.get(
+                    url, {'after': first.next_cursor}
+                ).context['page_obj']
+                self.assertFalse(second.has_next())
+                self.assertEqual(
+                    list(first) + list(second), expected
+                )
+                previous = self.guest_client.get(
+                    url, {'before': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(previous), list(first))
+                self.assertFalse(previous.has_previous())
+
+    def test_cursor_page_without_count_query(self):
+        """Keyset-страница не выполняет COUNT(*) и OFFSET."""
+        first = self.guest_client.get(self.urls[0]).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(self.urls[0], {'after': first.next_cursor})
+        for query in queries.captured_queries:
+            if 'FROM "posts_post"' not in query['sql']:
+                continue
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_cursor_links_keep_query(self):
+        """Ссылки на соседние страницы сохраняют остальные параметры."""
+        response = self.guest_client.get(self.urls[0], {'sort': 'new'})
+        page_obj = response.context['page_obj']
+        self.assertContains(
+            response, f'href="?sort=new&amp;after={page_obj.next_cursor}"'
+        )
+        response = self.guest_client.get(
+            self.urls[0], {'sort': 'new', 'after': page_obj.next_cursor}
+        )
+        self.assertContains(
+            response,
+            'href="?sort=new&amp;before='
+            f'{response.context["page_obj"].previous_cursor}"',
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный токен открывает первую страницу."""
+        response = self.guest_client.get(self.urls[0], {'after': 'broken'})
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_NUMBER
+        )
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_with_null_values_returns_first_page(self):
+        """Токен с пустыми значениями полей открывает первую страницу."""
+        for values in ('[null, null]', '["2020-01-01T00:00:00", null]'):
+            token = urlsafe_base64_encode(values.encode())
+            with self.subTest(values=values):
+                response = self.guest_client.get(
+                    self.urls[0], {'after': token}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(
+                    response.context['page_obj'].has_previous()
+                )
+                response = self.guest_client.get(
+                    reverse('posts:post_comments',
+                            kwargs={'post_id': Post.objects.first().pk}),
+                    {'after': token},
+                )
+                self.assertEqual(response.status_code, 200)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы',
+            slug='t_slug',
+            description='Тестовое описание группы',
+        )
+        authors = [
+            User.objects.create_user(username=f'Author{number}')
+            for number in range(3)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        posts = [
+            Post.objects.create(
+                author=authors[number % len(authors)],
+                text=f'Тестовый пост {number}',
+                group=cls.group
+            )
+            for number in range(12)
+        ]
+        Comment.objects.bulk_create([
+            Comment(post=post, author=cls.reader, text='Комментарий')
+            for post in posts
+        ])
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': authors[0]}),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def _queries_per_page(self, url, posts_number):
+        # Прогревочный запрос создаёт счётчики; страница из кеша прошлых
+        # тестов его бы пропустила.
+        cache.clear()
+        self.reader_client.get(url)
+        cache.clear()
+        with override_settings(POSTS_NUMBER=posts_number):
+            with CaptureQueriesContext(connection) as queries:
+                self.reader_client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов к БД на страницу ленты не зависит
+        от количества постов на странице.
+        """
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self._queries_per_page(url, 2),
+                    self._queries_per_page(url, 10),
+                    f'На странице "{url}" есть запросы на каждый пост'
+                )
+
+    def test_feed_posts_carry_comments_count(self):
+        """Посты ленты содержат число комментариев без доп. запросов."""
+        cache.clear()
+        response = self.reader_client.get(self.urls[0])
+        post = response.context['page_obj'][0]
+        with self.assertNumQueries(0):
+            self.assertEqual(post.comments_count, 1)
+            self.assertEqual(post.group, self.group)
+            self.assertTrue(post.author.username)
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostPagesTests(TestCase):
     @classmethod
@@ -295,17 +527,369 @@ class PostPagesTests(TestCase):
         """Проверка работы кеширования страницы index."""
         response_1 = self.authorized_client.get(self.url_index)
         old_content = response_1.content
+        response_2 = self.authorized_client.get(self.url_index)
+        cache_content = response_2.content
+        self.assertEqual(old_content, cache_content)
+        self.assertIsNone(
+            response_2.context, 'страница index не взята из кеша'
+        )
         Post.objects.create(
             text='Test',
             author=self.user
         )
-        response_2 = self.authorized_client.get(self.url_index)
-        cache_content = response_2.content
-        self.assertEqual(old_content, cache_content)
-        cache.clear()
         response_3 = self.authorized_client.get(self.url_index)
         new_content = response_3.content
         self.assertNotEqual(old_content, new_content)
+        self.assertIn('Test', new_content.decode())
+
+    def test_feed_cache_invalidated_by_rename(self):
+        """Смена имени автора и названия группы видна в закешированных
+        лентах, а вход пользователя их не сбрасывает.
+        """
+        self.authorized_client.get(self.url_index)
+        self.authorized_client.get(self.url_profile)
+        author = User.objects.get(pk=self.user.pk)
+        author.last_login = timezone.now()
+        author.save()
+        self.assertIsNone(self.authorized_client.get(self.url_index).context)
+        author.first_name = 'Новое имя'
+        author.save()
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        response = self.authorized_client.get(self.url_index)
+        self.assertContains(response, 'Новое имя')
+        self.assertContains(response, 'Новое название')
+        response = self.authorized_client.get(self.url_profile)
+        self.assertContains(response, 'Новое название')
+
+    def test_feed_cache_invalidated_by_group_delete(self):
+        """После удаления группы ленты не ссылаются на неё."""
+        group_url = reverse(
+            'posts:group_posts', kwargs={'slug': self.group.slug}
+        )
+        for url in (self.url_index, self.url_profile):
+            self.assertContains(self.authorized_client.get(url), group_url)
+        Group.objects.get(pk=self.group.pk).delete()
+        for url in (self.url_index, self.url_profile):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIsNotNone(response.context)
+                self.assertNotContains(response, group_url)
+
+    def test_feed_cache_invalidated_by_author_delete(self):
+        """После удаления автора его посты и комментарии пропадают из
+        закешированных лент.
+        """
+        author = User.objects.create_user(username='Author')
+        Post.objects.create(author=author, text='Пост автора')
+        Comment.objects.create(
+            post=self.post, author=author, text='Комментарий автора'
+        )
+        self.assertContains(
+            self.authorized_client.get(self.url_index), 'Пост автора'
+        )
+        self.authorized_client.get(self.url_profile)
+        author.delete()
+        response = self.authorized_client.get(self.url_index)
+        self.assertIsNotNone(response.context)
+        self.assertNotContains(response, 'Пост автора')
+        self.assertIsNotNone(
+            self.authorized_client.get(self.url_profile).context
+        )
+
+    def test_index_cache_invalidated_from_other_process(self):
+        """Смена поколения в общем кеше (например, другим процессом)
+        сбрасывает страницу и в LRU этого процесса.
+        """
+        self.authorized_client.get(self.url_index)
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Изменённый текст', edited=timezone.now()
+        )
+        cache.incr(GENERATION_KEY % index_scope())
+        response = self.authorized_client.get(self.url_index)
+        self.assertContains(response, 'Изменённый текст')
+
+    def test_stale_index_served_while_rebuild_locked(self):
+        """Пока страницу пересобирает другой запрос, отдаётся устаревшая
+        копия, после снятия блокировки - новая.
+        """
+        old_content = self.authorized_client.get(self.url_index).content
+        Post.objects.create(text='Новый пост', author=self.user)
+        request = RequestFactory().get(self.url_index)
+        request.user = self.user
+        lock = page_key(request, index_scope()) + ':lock'
+        cache.add(lock, 1)
+        response = self.authorized_client.get(self.url_index)
+        self.assertEqual(response.content, old_content)
+        cache.delete(lock)
+        response = self.authorized_client.get(self.url_index)
+        self.assertContains(response, 'Новый пост')
+
+    @override_settings(POSTS_CACHE_SOFT_TIMEOUT=0)
+    def test_index_refreshed_after_soft_timeout(self):
+        """После мягкого срока страница пересобирается без смены
+        поколения.
+        """
+        self.authorized_client.get(self.url_index)
+        response = self.authorized_client.get(self.url_index)
+        self.assertIsNotNone(response.context)
+
+    @override_settings(POSTS_CACHE_SOFT_TIMEOUT=0)
+    def test_soft_refresh_changes_etag(self):
+        """Пересборка после мягкого срока без смены поколения отдаёт новое
+        содержимое с новым ETag, а неизменное - с прежним.
+        """
+        etag = self.authorized_client.get(self.url_index)['ETag']
+        response = self.authorized_client.get(
+            self.url_index, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        # bulk_create не вызывает сигналов, поколение остаётся прежним.
+        Post.objects.bulk_create([Post(text='Новый пост', author=self.user)])
+        response = self.authorized_client.get(
+            self.url_index, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый пост')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_cache_invalidated_by_comment(self):
+        """Новый комментарий сбрасывает кеш index, group_list и profile."""
+        urls = (self.url_index, self.url_group, self.url_profile)
+        old_content = {
+            url: self.authorized_client.get(url).content for url in urls
+        }
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Комментарий'},
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIsNotNone(response.context)
+                self.assertNotEqual(response.content, old_content[url])
+
+    def test_feed_not_modified(self):
+        """Ленты отвечают 304 на If-None-Match текущего поколения и новым
+        ETag после изменений.
+        """
+        urls = (self.url_index, self.url_group, self.url_profile)
+        etags = {url: self.authorized_client.get(url)['ETag'] for url in urls}
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etags[url])
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertIn('private', response['Cache-Control'])
+        Post.objects.create(text='Новый пост', author=self.user,
+                            group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[url])
+
+    def test_feed_etag_depends_on_user(self):
+        """ETag ленты у разных пользователей разный."""
+        guest_response = Client().get(self.url_index)
+        response = self.authorized_client.get(
+            self.url_index, HTTP_IF_NONE_MATCH=guest_response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', guest_response['Cache-Control'])
+
+    def test_post_detail_not_modified(self):
+        """post_detail проверяет ETag одним запросом и отдаёт 304, пока
+        пост и его комментарии не менялись.
+        """
+        guest_client = Client()
+        etag = guest_client.get(self.url_post)['ETag']
+        with self.assertNumQueries(1):
+            response = guest_client.get(
+                self.url_post, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        response = guest_client.get(self.url_post, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментарий')
+
+    def test_post_detail_etag_changes_on_login(self):
+        """После нового входа форма комментария несёт новый CSRF-токен,
+        поэтому старая копия страницы не подходит.
+        """
+        User.objects.create_user(username='reader', password='secret-pass')
+        client = Client(enforce_csrf_checks=True)
+        login_url = reverse('users:login')
+
+        def log_in():
+            client.get(login_url)
+            client.post(login_url, {
+                'username': 'reader', 'password': 'secret-pass',
+                'csrfmiddlewaretoken':
+                    client.cookies[settings.CSRF_COOKIE_NAME].value,
+            })
+
+        log_in()
+        etag = client.get(self.url_post)['ETag']
+        self.assertEqual(
+            client.get(self.url_post, HTTP_IF_NONE_MATCH=etag).status_code,
+            304,
+        )
+        log_in()
+        response = client.get(self.url_post, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={
+                'text': 'После входа',
+                'csrfmiddlewaretoken':
+                    client.cookies[settings.CSRF_COOKIE_NAME].value,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_post_detail_etag_changes_on_commenter_rename(self):
+        """Смена имени автора комментария меняет ETag поста."""
+        reader = User.objects.create_user(username='reader')
+        Comment.objects.create(post=self.post, author=reader, text='Привет')
+        guest_client = Client()
+        etag = guest_client.get(self.url_post)['ETag']
+        reader.first_name = 'Читатель'
+        reader.save()
+        response = guest_client.get(self.url_post, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Читатель')
+
+
+@override_settings(COMMENTS_NUMBER=10)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        for number in range(25):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader{number}'),
+                text=f'Комментарий {number}',
+            )
+        cls.url_post = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.id}
+        )
+        cls.url_comments = reverse(
+            'posts:post_comments', kwargs={'post_id': cls.post.id}
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def _texts(self, page):
+        return [comment.text for comment in page]
+
+    def test_post_detail_shows_first_comments(self):
+        """post_detail показывает первую страницу комментариев по порядку
+        написания, авторы загружаются вместе с комментариями.
+        """
+        self.guest_client.get(self.url_post)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.url_post)
+        page = response.context['page_obj']
+        self.assertEqual(
+            self._texts(page), [f'Комментарий {n}' for n in range(10)]
+        )
+        self.assertTrue(page.has_next())
+        comment_queries = [
+            query for query in queries.captured_queries
+            if 'FROM "posts_comment"' in query['sql']
+            and 'auth_user' in query['sql']
+        ]
+        self.assertEqual(len(comment_queries), 1)
+
+    def test_comments_fragment_continues_from_cursor(self):
+        """Фрагмент отдаёт следующие комментарии после курсора."""
+        first = self.guest_client.get(self.url_post).context['page_obj']
+        response = self.guest_client.get(
+            self.url_comments, {'after': first.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        second = response.context['page_obj']
+        self.assertEqual(
+            self._texts(second), [f'Комментарий {n}' for n in range(10, 20)]
+        )
+        last = self.guest_client.get(
+            self.url_comments, {'after': second.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(last), 5)
+        self.assertFalse(last.has_next())
+
+    def test_comments_fragment_for_missing_post(self):
+        """Фрагмент несуществующего поста - 404."""
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовое поле поста',
+        )
+        cls.url_index = reverse('posts:index')
+        cls.url_edit = reverse(
+            'posts:post_edit', kwargs={'post_id': cls.post.id}
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def test_post_card_cached_by_post_and_edit_stamp(self):
+        """Карточка поста кешируется по id, времени изменения поста
+        и готовой миниатюре (у поста без картинки её нет).
+        """
+        self.reader_client.get(self.url_index)
+        key = make_template_fragment_key(
+            'post_card', [self.post.id, self.post.edited.isoformat(), '']
+        )
+        self.assertIn('Тестовое поле поста', cache.get(key))
+        self.author_client.post(
+            self.url_edit, data={'text': 'Новый текст поста'}
+        )
+        response = self.reader_client.get(self.url_index)
+        self.assertContains(response, 'Новый текст поста')
+        self.assertNotContains(response, 'Тестовое поле поста')
+
+    def test_edit_link_rendered_outside_card_cache(self):
+        """Ссылка редактирования видна только автору при общем кеше
+        карточки.
+        """
+        self.reader_client.get(self.url_index)
+        self.assertContains(
+            self.author_client.get(self.url_index), self.url_edit
+        )
+        self.assertNotContains(
+            self.reader_client.get(self.url_index), self.url_edit
+        )
 
 
 class FollowTests(TestCase):
@@ -411,3 +995,137 @@ class FollowTests(TestCase):
         """
         response = self.follower_client.get(self.url_follow_index)
         self.assertNotIn(self.post, response.context['page_obj'].object_list)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.url_follow_index = reverse('posts:follow_index')
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        cache.clear()
+
+    def _follow_feed(self):
+        response = self.follower_client.get(self.url_follow_index)
+        return list(response.context['page_obj'])
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост попадает в материализованную ленту подписчика."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower, post=post
+            ).exists()
+        )
+        self.assertEqual(self._follow_feed(), [post])
+
+    def test_unfollow_removes_author_posts(self):
+        """После отписки посты автора убираются из ленты."""
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        Post.objects.create(author=self.author, text='Новый пост')
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+        self.assertEqual(self._follow_feed(), [])
+
+    def test_rebuild_timelines_command(self):
+        """Команда пересобирает ленты и убирает записи читателей без
+        подписок.
+        """
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        TimelineEntry.objects.filter(user=self.follower).delete()
+        TimelineEntry.objects.create(
+            user=reader, post=post, pub_date=post.pub_date
+        )
+        call_command('rebuild_timelines', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(self.follower.pk, post.pk)],
+        )
+        self.assertEqual(self._follow_feed(), [post])
+
+    @override_settings(TIMELINE_MAX_POSTS=2)
+    def test_timeline_trimmed_to_cap(self):
+        """Лента подписчика обрезается до TIMELINE_MAX_POSTS постов."""
+        for number in range(3):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        Follow.objects.create(user=self.follower, author=self.author)
+        newest = Post.objects.create(author=self.author, text='Последний')
+        entries = TimelineEntry.objects.filter(user=self.follower)
+        self.assertEqual(entries.count(), 2)
+        self.assertEqual(entries.first().post, newest)
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_read_on_request(self):
+        """Посты авторов с большим числом подписчиков не раскладываются
+        по лентам, а подмешиваются при чтении.
+        """
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self._follow_feed(), [post])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_read_time_posts_merged_in_order(self):
+        """Посты популярного автора подмешиваются в ленту в порядке
+        публикации, в том числе при переходе по курсору.
+        """
+        other = User.objects.create_user(username='Other')
+        reader = User.objects.create_user(username='Reader')
+        UserStats.objects.for_user(self.author)
+        Follow.objects.create(user=reader, author=self.author)
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=other)
+        posts = [
+            Post.objects.create(
+                author=(self.author, other)[number % 2],
+                text=f'Пост {number}',
+            )
+            for number in range(5)
+        ]
+        expected = posts[::-1]
+        self.assertEqual(self._follow_feed(), expected)
+        with override_settings(POSTS_PAGINATION='cursor', POSTS_NUMBER=2):
+            pages = []
+            response = self.follower_client.get(self.url_follow_index)
+            while True:
+                page_obj = response.context['page_obj']
+                pages += list(page_obj)
+                if not page_obj.has_next():
+                    break
+                response = self.follower_client.get(
+                    self.url_follow_index, {'after': page_obj.next_cursor}
+                )
+            self.assertEqual(pages, expected)
+            previous = self.follower_client.get(
+                self.url_follow_index, {'before': page_obj.previous_cursor}
+            ).context['page_obj']
+            self.assertEqual(list(previous), expected[2:4])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_posts_backfilled_when_author_drops_below_threshold(self):
+        """Когда подписчиков у автора снова не больше порога, посты,
+        написанные выше порога, раскладываются по лентам.
+        """
+        reader = User.objects.create_user(username='Reader')
+        UserStats.objects.for_user(self.author)
+        Follow.objects.create(user=self.follower, author=self.author)
+        follow = Follow.objects.create(user=reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        follow.delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower, post=post
+            ).exists()
+        )
+        self.assertEqual(self._follow_feed(), [post])
@@ -0,0 +1,173 @@
+"""Подготовка миниатюр изображений постов вне запроса.
+
+Тег {% thumbnail %} создаёт миниатюру при первом показе страницы, и первый
+посетитель ждёт, пока Pillow уменьшит картинку. Здесь миниатюры готовятся
+в пуле потоков после сохранения поста, а шаблон только проверяет, готова
+ли миниатюра, и до тех пор показывает оригинал. Когда миниатюра готова,
+кеш страниц лент с этим изображением сбрасывается.
+
+Для каждого изображения готовится набор вариантов: несколько ширин
+в форматах WebP и JPEG, из которых шаблон собирает <picture> со srcset.
+"""
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from . import cache as pages
+from .constants import (thumbnailFormats, thumbnailOptions, thumbnailSize,
+                        thumbnailWidths)
+from .models import Post
+
+PICTURE_KEY = 'posts:picture:%s'
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class Picture(namedtuple('Picture', 'url width height srcset sources')):
+    """Готовые варианты изображения для тега <picture>.
+
+    url, width, height и srcset относятся к вариантам в основном формате
+    (последний в thumbnailFormats), sources - пары (MIME-тип, srcset)
+    для остальных форматов.
+    """
+
+    @classmethod
+    def from_variants(cls, variants):
+        by_format = {}
+        for image_format, thumbnail in variants:
+            by_format.setdefault(image_format, []).append(thumbnail)
+
+        def srcset(thumbnails):
+            return ', '.join(f'{im.url} {im.width}w' for im in thumbnails)
+
+        *extra, main = thumbnailFormats
+        largest = by_format[main][-1]
+        return cls(
+            url=largest.url,
+            width=largest.width,
+            height=largest.height,
+            srcset=srcset(by_format[main]),
+            sources=tuple(
+                (MIME_TYPES[image_format], srcset(by_format[image_format]))
+                for image_format in extra
+            ),
+        )
+
+
+def variants():
+    """Пары (формат, геометрия) всех вариантов миниатюры."""
+    width, height = thumbnailSize
+    for image_format in thumbnailFormats:
+        for variant_width in thumbnailWidths:
+            yield image_format, '%sx%s' % (
+                variant_width, round(height * variant_width / width)
+            )
+
+
+def picture_key(name):
+    return PICTURE_KEY % md5(name.encode()).hexdigest()
+
+
+def ready(name):
+    """Picture для изображения name или None, если миниатюра не готова.
+
+    Ничего не создаёт. Picture попадает в кеш, когда generate создаст все
+    варианты; если его вытеснили, шаблон снова поставит изображение
+    в очередь, и generate соберёт Picture из уже созданных файлов.
+    """
+    if not name:
+        return None
+    return cache.get(picture_key(name))
+
+
+def _invalidate_pages(name):
+    """Сбрасывает кеш страниц лент с постами, где есть изображение name."""
+    # По индексу на Post.image, без сортировки.
+    posts = Post.objects.filter(image=name).order_by().values_list(
+        'author__username', 'group__slug'
+    )
+    scopes = {pages.index_scope()}
+    for username, slug in posts:
+        scopes.add(pages.profile_scope(username))
+        if slug is not None:
+            scopes.add(pages.group_scope(slug))
+    pages.bump(*scopes)
+
+
+def generate(name):
+    """Создаёт недостающие варианты в текущем потоке и возвращает Picture.
+
+    get_thumbnail находит уже созданные варианты в хранилище ключей sorl
+    и не уменьшает картинку повторно.
+    """
+    found = [
+        (image_format, get_thumbnail(
+            name, geometry, format=image_format, **thumbnailOptions
+        ))
+        for image_format, geometry in variants()
+    ]
+    picture = Picture.from_variants(found)
+    if cache.get(picture_key(name)) != picture:
+        cache.set(picture_key(name), picture, None)
+        # Ленты, закешированные с оригиналом, должны показать миниатюру.
+        _invalidate_pages(name)
+    return picture
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру для %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        # У каждого потока пула своё соединение с базой (хранилище ключей
+        # sorl), не оставляем его открытым между задачами.
+        connection.close()
+
+
+def _submit(name):
+    global _executor
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run, name)
+
+
+def schedule(name):
+    """Ставит создание миниатюры в очередь после фиксации транзакции.
+
+    При POSTS_THUMBNAILS_ASYNC = False миниатюра создаётся сразу.
+    """
+    if not name:
+        return
+    if not settings.POSTS_THUMBNAILS_ASYNC:
+        generate(name)
+        return
+    transaction.on_commit(lambda: _submit(name))
+
+
+def delete(name):
+    """Удаляет миниатюры изображения name и их записи в хранилище ключей."""
+    default.kvstore.delete(ImageFile(name))
+    cache.delete(picture_key(name))
@@ -0,0 +1,228 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост автора раскладывается в TimelineEntry каждого подписчика, так
+что follow_index читает готовый список по индексу (user, pub_date, post)
+вместо JOIN по Follow и Post.
+Посты авторов, у которых подписчиков больше
+TIMELINE_FANOUT_MAX_FOLLOWERS, не раскладываются и подмешиваются
+в ленту при чтении (fan-out on read): FollowFeed сливает записи ленты
+с постами таких авторов, читая каждый источник по своему индексу.
+Когда у автора снова становится не больше TIMELINE_FANOUT_MAX_FOLLOWERS
+подписчиков, его последние посты раскладываются всем подписчикам, иначе
+посты, написанные выше порога, пропали бы из их лент.
+"""
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator, seek
+
+BATCH_SIZE = 500
+
+
+def is_fanned_out(author):
+    stats = UserStats.objects.for_user(author)
+    return stats.followers_count <= settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(post):
+    """Добавляет пост в ленты подписчиков автора."""
+    if not is_fanned_out(post.author):
+        return
+    followers = list(
+        Follow.objects
+        .filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(followers)
+
+
+def recent_posts(author_id):
+    """(pk, pub_date) последних TIMELINE_MAX_POSTS постов автора."""
+    return list(
+        Post.objects
+        .filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:settings.TIMELINE_MAX_POSTS]
+    )
+
+
+def add_posts(user_ids, posts):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id in user_ids
+            for post_id, pub_date in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_ids)
+
+
+def backfill(follow):
+    """Заполняет ленту подписчика последними постами автора."""
+    if not is_fanned_out(follow.author):
+        return
+    add_posts([follow.user_id], recent_posts(follow.author_id))
+
+
+def backfill_author(author_id):
+    """Раскладывает последние посты автора всем его подписчикам.
+
+    Нужна, когда автор опускается до порога раскладки: пока подписчиков
+    было больше, его посты в ленты не попадали.
+    """
+    posts = recent_posts(author_id)
+    if not posts:
+        return
+    followers = (
+        Follow.objects
+        .filter(author_id=author_id)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+    )
+    users_per_batch = max(1, BATCH_SIZE // len(posts))
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            followers.filter(user_id__gt=last_user_id)[:users_per_batch]
+        )
+        if not user_ids:
+            return
+        last_user_id = user_ids[-1]
+        add_posts(user_ids, posts)
+
+
+def follower_lost(author_id):
+    """Раскладывает посты автора, если после отписки он вернулся
+    к порогу раскладки.
+    """
+    if UserStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+    ).exists():
+        backfill_author(author_id)
+
+
+def remove(follow):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+
+
+def trim(user_ids):
+    """Оставляет в лентах не больше TIMELINE_MAX_POSTS последних постов."""
+    limit = settings.TIMELINE_MAX_POSTS
+    overflowing = (
+        TimelineEntry.objects
+        .filter(user_id__in=user_ids)
+        .order_by()
+        .values('user_id')
+        .annotate(total=Count('pk'))
+        .filter(total__gt=limit)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in overflowing:
+        entries = TimelineEntry.objects.filter(user_id=user_id)
+        oldest_kept = entries.order_by('-pub_date', '-post_id')[limit - 1]
+        entries.filter(
+            Q(pub_date__lt=oldest_kept.pub_date)
+            | Q(
+                pub_date=oldest_kept.pub_date,
+                post_id__lt=oldest_kept.post_id,
+            )
+        ).delete()
+
+
+class FollowFeed:
+    """Лента подписок пользователя: записи TimelineEntry и посты авторов,
+    читаемых при запросе, слитые в порядке (-pub_date, -id поста).
+
+    Каждый источник читается по своему индексу и не дальше, чем нужно
+    странице. Пост может оказаться в обоих источниках, если автор перешёл
+    порог раскладки, поэтому повторы убираются при слиянии. Для Paginator
+    есть count() и срезы, для keyset-пагинации - FollowFeedPaginator.
+    """
+
+    model = Post
+
+    def __init__(self, user):
+        self.user = user
+        self.read_time_authors = list(Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+            ),
+        ).values_list('author_id', flat=True))
+        # Источник и поле с id поста в нём.
+        self.sources = [(TimelineEntry.objects.filter(user=user), 'post_id')]
+        self.sources += [
+            (Post.objects.filter(author_id=author_id), 'pk')
+            for author_id in self.read_time_authors
+        ]
+
+    def keys(self, limit, position=None, backwards=False):
+        """Первые limit пар (pub_date, id поста) после position (до неё
+        при backwards) в порядке обхода.
+        """
+        merged = []
+        for queryset, post_id in self.sources:
+            ordering = ('-pub_date', '-' + post_id)
+            if position is not None:
+                queryset = queryset.filter(
+                    seek(ordering, position, backwards)
+                )
+            if backwards:
+                ordering = ('pub_date', post_id)
+            merged += queryset.order_by(*ordering).values_list(
+                'pub_date', post_id
+            )[:limit]
+        merged.sort(reverse=not backwards)
+        keys = []
+        for key in merged:
+            if not keys or keys[-1] != key:
+                keys.append(key)
+        return keys[:limit]
+
+    def posts(self, keys):
+        ids = [post_id for _, post_id in keys]
+        posts = Post.objects.feed().order_by().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+    def count(self):
+        count = TimelineEntry.objects.filter(user=self.user).count()
+        if self.read_time_authors:
+            count += UserStats.objects.filter(
+                user_id__in=self.read_time_authors
+            ).aggregate(total=Sum('posts_count'))['total'] or 0
+            # Посты, разложенные до перехода автора через порог.
+            count -= TimelineEntry.objects.filter(
+                user=self.user, post__author_id__in=self.read_time_authors
+            ).count()
+        return count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        return self.posts(self.keys(index.stop)[index.start or 0:])
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Keyset-пагинация FollowFeed по (pub_date, id поста)."""
+
+    def _fetch(self, position, backwards, limit):
+        feed = self.object_list
+        return feed.posts(feed.keys(limit, position, backwards))
@@ -1,58 +1,171 @@
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.utils.http import urlencode
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.db.models import Count, Max
 
+from core.routers import replica_reads
+
+from . import thumbnails, timeline
+from .cache import (
+    commenters_scope, conditional_page, generation, group_scope, index_scope,
+    profile_scope, versioned_cache_page
+)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .constants import cacheTime, stringLength
+from .models import Follow, Group, Post, PostCounter, User, UserStats
+from .constants import stringLength
+from .paginators import CountedPaginator, CursorPaginator, elided_page_range
+from .search import get_backend as search_backend
 
 
 user = User()
 
 
-def paginator(request, queryset):
-    page = Paginator(queryset, settings.POSTS_NUMBER)
+def pagination_query(request):
+    """Параметры запроса без номера страницы и курсора, чтобы ссылки
+    пагинатора их сохраняли: строка для "?{{ pagination_query }}page=".
+    """
+    query = request.GET.copy()
+    for name in ('page', 'after', 'before'):
+        query.pop(name, None)
+    return query.urlencode() + '&' if query else ''
+
+
+def comments_page(request, post):
+    """Страница комментариев поста в порядке написания, по курсору."""
+    comments = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_NUMBER,
+        ordering=('created', 'pk'),
+    )
+    return comments.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def numbered_page(request, object_list, total=None):
+    """Страница с номером из ?page=; total - функция, возвращающая
+    значение счётчика записей, чтобы не считать их COUNT(*).
+    """
+    threshold = settings.POSTS_EXACT_COUNT_THRESHOLD
+    if total is None or threshold is None:
+        page = Paginator(object_list, settings.POSTS_NUMBER)
+    else:
+        page = CountedPaginator(
+            object_list, settings.POSTS_NUMBER, total, threshold
+        )
     page_number = request.GET.get('page')
-    return page.get_page(page_number)
+    page_obj = page.get_page(page_number)
+    page_obj.elided_page_range = elided_page_range(page_obj)
+    return page_obj
+
 
+def paginator(request, queryset, total=None,
+              cursor_paginator=CursorPaginator):
+    if settings.POSTS_PAGINATION == 'cursor':
+        page = cursor_paginator(queryset, settings.POSTS_NUMBER)
+        return page.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    return numbered_page(request, queryset, total)
 
-@cache_page(cacheTime, key_prefix='index_page')
+
+@replica_reads
+@versioned_cache_page(index_scope)
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = paginator(request, post_list)
+    post_list = Post.objects.feed()
+    page_obj = paginator(request, post_list, lambda: PostCounter.objects.value(
+        PostCounter.index_scope(), Post.objects.all()
+    ))
     template = 'posts/index.html'
-    context = {'page_obj': page_obj, }
+    context = {
+        'page_obj': page_obj,
+        'pagination_query': pagination_query(request),
+    }
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = search_backend().search(query) if query else []
+    page_obj = numbered_page(request, results)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'pagination_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@replica_reads
+@versioned_cache_page(group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.POSTS_NUMBER)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.feed()
+    page_obj = paginator(request, posts, lambda: PostCounter.objects.value(
+        PostCounter.group_scope(group.pk), group.posts.all()
+    ))
     return render(request, 'posts/group_list.html', {
-        'group': group, 'posts': posts, 'page_obj': page_obj})
+        'group': group, 'posts': posts, 'page_obj': page_obj,
+        'pagination_query': pagination_query(request)})
 
 
+@replica_reads
+@versioned_cache_page(profile_scope)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    paginator = Paginator(author.posts.all(), settings.POSTS_NUMBER)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    stats = UserStats.objects.for_user(author)
+    page_obj = paginator(
+        request, author.posts.feed(), lambda: stats.posts_count
+    )
     following = False
     if request.user.is_authenticated:
         following = author.following.filter(user=request.user).exists()
     context = {
         'author': author,
+        'stats': stats,
         'page_obj': page_obj,
+        'pagination_query': pagination_query(request),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_detail_etag(request, post_id):
+    """Время изменения поста, число и время последнего комментария одним
+    запросом; поколение профиля автора меняется вместе со счётчиками
+    и подписками, а готовность миниатюры - при замене оригинала. Имена
+    комментаторов сверяются по общему поколению, а вошедшему пользователю
+    форма комментария несёт CSRF-токен, который меняется при входе.
+    """
+    # Срез вместо first(): сортировка по pk заставила бы SQLite сортировать
+    # сгруппированный результат во временном B-дереве.
+    state = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'edited', 'image'
+    ).annotate(
+        Count('comments'), Max('comments__created')
+    ).order_by()[:1]
+    if not state:
+        return None
+    (username, edited, image, comments, last_comment), = state
+    csrf_secret = None
+    if request.user.is_authenticated:
+        csrf_secret = request.META.get('CSRF_COOKIE')
+    return (
+        request.user.pk, csrf_secret, request.get_full_path(),
+        edited.isoformat(), comments, last_comment,
+        generation(profile_scope(username)),
+        generation(commenters_scope()),
+        thumbnails.ready(image) is not None,
+    )
+
+
+@replica_reads
+@conditional_page(post_detail_etag)
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects
@@ -62,28 +175,37 @@ def post_detail(request, post_id):
     if request.user.is_authenticated:
         following = post.author.following.filter(user=request.user).exists()
     form = CommentForm()
-    comments_list = post.comments.all()
-    comments_obj = comments_list
     context = {
         'post': post,
         'id': post_id,
-        'page_obj': comments_obj,
+        'page_obj': comments_page(request, post),
+        'pagination_query': pagination_query(request),
         'page_title': post.text[:stringLength * 2],
         'form': form,
         'following': following,
-        'author': post.author
+        'author': post.author,
+        'stats': UserStats.objects.for_user(post.author),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@replica_reads
+@conditional_page(post_detail_etag)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post, id=post_id)
+    return render(request, 'posts/includes/comments.html', {
+        'post': post, 'page_obj': comments_page(request, post),
+        'pagination_query': pagination_query(request)})
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
         return render(request, 'posts/post_create.html', {'form': form})
-    post = form.save(commit=False)
-    post.author = request.user
-    post.save()
+    form.instance.author = request.user
+    post = form.save()
     return redirect('posts:profile', post.author)
 
 
@@ -122,18 +244,23 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@replica_reads
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
+    page_obj = paginator(
+        request, timeline.FollowFeed(request.user),
+        cursor_paginator=timeline.FollowFeedPaginator,
     )
-    page_obj = paginator(request, posts)
     template = 'posts/follow.html'
-    context = {'page_obj': page_obj, }
+    context = {
+        'page_obj': page_obj,
+        'pagination_query': pagination_query(request),
+    }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = User.objects.get(username=username)
     user = request.user
@@ -144,6 +271,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     user = request.user
     if Follow.objects.filter(user=user, author__username=username).exists():
@@ -35,7 +35,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,7 +52,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,13 +73,51 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Opt-in production SQLite profile (YATUBE_SQLITE_PRODUCTION=1): every new
+# connection runs SQLITE_PRAGMAS (WAL journal so readers do not block the
+# writer, waiting on locks instead of failing with "database is locked",
+# mmap and a larger page cache), and connections are kept open for
+# CONN_MAX_AGE seconds instead of being reopened on every request.
+# `manage.py sqlite_benchmark` compares throughput with and without it.
+SQLITE_PRODUCTION = os.environ.get('YATUBE_SQLITE_PRODUCTION') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2 ** 20,
+    # Negative values are KiB rather than pages.
+    'cache_size': -64 * 2 ** 10,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60 if SQLITE_PRODUCTION else 0,
     }
 }
 
+# Read-only views (marked with core.routers.replica_reads) read models of
+# DATABASE_REPLICA_APPS from one of the DATABASE_REPLICAS aliases; sessions
+# and users always come from the primary. A POST, or a request that writes
+# models of DATABASE_REPLICA_APPS, sets a cookie that keeps the user's reads
+# on the primary for DATABASE_REPLICA_LAG seconds, so they see their own
+# posts, comments and follows; session and last_login saves do not. Cached
+# feed pages built from a replica are refreshed after the same delay.
+# YATUBE_DB_REPLICA points a stand-in replica at another SQLite file (e.g. a
+# copy kept fresh with `sqlite3 db.sqlite3 ".backup ..."`).
+if os.environ.get('YATUBE_DB_REPLICA'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ['YATUBE_DB_REPLICA'],
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_LAG = 5
+DATABASE_REPLICA_APPS = ['posts']
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -119,6 +159,23 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# Sessions are read from the cache; changed sessions are written to the
+# database by a background thread after the response (new sessions are
+# written at once so key collisions are caught). SESSION_WRITE_BEHIND =
+# False writes through like the cached_db engine; so does a cache that is
+# private to the process ('locmem' below), since other workers could not
+# see the pending change.
+SESSION_ENGINE = 'core.sessions'
+SESSION_WRITE_BEHIND = True
+
+# The session user is loaded from the cache instead of auth_user on every
+# request; saving or deleting the user drops the cached copy. Together
+# with cached sessions, a feed page served from the page cache does no
+# database queries. With a per-process cache the user is not cached: a
+# dropped copy would live on in the other workers.
+AUTHENTICATION_BACKENDS = ['core.auth.CachedModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 300
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -126,12 +183,113 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_NUMBER = 10
+# Numbered feed pages take their total from counters maintained by post
+# signals (global, per group, per author) instead of COUNT(*); an exact
+# count is still run when the counter is at or below this threshold.
+# None always counts exactly.
+POSTS_EXACT_COUNT_THRESHOLD = 1000
+COMMENTS_NUMBER = 20
+# 'pages' - numbered pages (?page=), 'cursor' - keyset pagination over
+# (pub_date, id) with opaque ?after=/?before= tokens, no COUNT(*) or OFFSET.
+POSTS_PAGINATION = 'pages'
+
+# Follow feed is materialized per reader (fan-out on write) and capped at
+# TIMELINE_MAX_POSTS entries. Authors with more followers than
+# TIMELINE_FANOUT_MAX_FOLLOWERS are merged into the feed at read time.
+TIMELINE_MAX_POSTS = 1000
+TIMELINE_FANOUT_MAX_FOLLOWERS = 5000
+
+# Dotted path to a posts search backend class; None picks SQLite FTS5 on
+# sqlite and plain icontains matching on other databases.
+POSTS_SEARCH_BACKEND = None
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
+# Cache backend is chosen by name: 'locmem' keeps a private cache in every
+# worker process, 'sqlite' is a file-backed cache shared by all workers on
+# the host (LRU eviction, entry and byte limits, values above
+# MAX_VALUE_SIZE are not cached), 'db' uses the Django database cache
+# (run `manage.py createcachetable` first).
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 256 * 2 ** 20,
+            'MAX_VALUE_SIZE': 8 * 2 ** 20,
+        },
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'yatube_cache',
+    },
 }
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Feed pages are keyed by a generation that post, comment and follow changes
+# bump, so they can be kept until evicted (None = no expiry).
+POSTS_CACHE_TIMEOUT = None
+# Hot feed pages are also kept in a small per-process LRU in front of the
+# shared cache; generation keys are always read from the shared cache.
+POSTS_LOCAL_CACHE_MAX_ENTRIES = 256
+POSTS_LOCAL_CACHE_TIMEOUT = 5
+# A stale page is rebuilt by the single request holding the rebuild lock
+# (up to POSTS_CACHE_LOCK_TIMEOUT seconds) while others get the stale copy,
+# or wait up to POSTS_CACHE_LOCK_WAIT seconds when there is none. Pages are
+# also refreshed probabilistically before POSTS_CACHE_SOFT_TIMEOUT runs
+# out (None disables time-based refresh).
+POSTS_CACHE_SOFT_TIMEOUT = 600
+POSTS_CACHE_EARLY_REFRESH_BETA = 1.0
+POSTS_CACHE_LOCK_TIMEOUT = 10
+POSTS_CACHE_LOCK_WAIT = 2
+
+# Post thumbnails are generated by a background thread pool after the post
+# is saved; pages show the original image until the thumbnail is ready.
+# With POSTS_THUMBNAILS_ASYNC = False they are generated inline instead.
+POSTS_THUMBNAILS_ASYNC = True
+POSTS_THUMBNAIL_WORKERS = 2
+
+# Uploaded post images are normalized before they are stored: EXIF
+# orientation is applied, metadata is dropped, images larger than
+# POSTS_IMAGE_MAX_SIZE are downscaled, and everything is re-encoded (JPEG
+# at POSTS_IMAGE_QUALITY, PNG when there is transparency). Animated images
+# are kept as uploaded. Output is buffered in memory up to
+# POSTS_IMAGE_SPOOL_SIZE bytes, then spilled to a temporary file. Only JPEG
+# can be decoded at a reduced scale, so uploads whose decoded raster has
+# more than POSTS_IMAGE_MAX_PIXELS pixels are rejected (25 megapixels is
+# about 100 MB as RGBA).
+POSTS_IMAGE_NORMALIZE = True
+POSTS_IMAGE_MAX_SIZE = (2560, 2560)
+POSTS_IMAGE_QUALITY = 85
+POSTS_IMAGE_SPOOL_SIZE = 4 * 2 ** 20
+POSTS_IMAGE_MAX_PIXELS = 25 * 10 ** 6
+
+# Post images that are replaced or lose their last post are deleted along
+# with their thumbnails once the transaction commits, unless they were
+# written less than POSTS_MEDIA_GRACE_PERIOD seconds ago (another upload of
+# the same content may be using them). `manage.py gc_media` sweeps up
+# everything left over, by default with the same grace period.
+POSTS_MEDIA_GRACE_PERIOD = 600
+
+# Responses to staff users carry a Server-Timing header (database time and
+# query count, template time without the queries run while rendering, page
+# cache result, total); METRICS_SERVER_TIMING = True sends it to everyone,
+# e.g. on a staging host. The same timings are aggregated per view into
+# histograms that /metrics serves in the Prometheus text format to staff
+# users, or to a scraper sending "Authorization: Bearer <METRICS_TOKEN>".
+# Metrics are kept per process.
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+METRICS_SERVER_TIMING = False